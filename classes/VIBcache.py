@@ -0,0 +1,148 @@
+import numpy as np
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import time
+import warnings
+from contextlib import closing
+
+# Import functions
+from functions.data.utils import jsonable
+
+class VIBcache():
+    def __init__(self, name = 'VIB_Cache.db', maxbytes = 512*2**20, matrices = False):
+        """
+        Content-addressed cache of analysis results on disk. VIBframe hashes its input and looks
+        the hash up before assembling and solving, so re-running an identical analysis (examples,
+        repeated sweep points, notebook reloads) returns the stored omega and U at once. The
+        cache is an SQLite database bounded by size, least recently used entries are evicted.
+
+        Parameters
+        ----------
+        name : str, optional
+            Name of the cache database (default is 'VIB_Cache.db')
+        maxbytes : int, optional
+            Maximum total size of the cached results in bytes (default is 512 MiB)
+        matrices : bool, optional
+            If True, K and M are cached with omega and U. Otherwise a model served from the
+            cache assembles K and M again, only the eigen solution is skipped (default is False)
+        """
+
+        self.db_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + '/' + name
+        self.maxbytes = int(maxbytes)
+        self.matrices = matrices
+
+        # Number of lookups served from the cache (hits) and not found (misses), entries evicted
+        # and results not stored because they exceed maxbytes (rejected)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejected = 0
+
+        with closing(self._connect()) as con:
+            con.execute("PRAGMA journal_mode = WAL")
+            con.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                nbytes INTEGER NOT NULL,
+                atime REAL NOT NULL
+            )
+            """)
+            con.execute("CREATE INDEX IF NOT EXISTS idx_results_atime ON results(atime)")
+            con.commit()
+
+    @staticmethod
+    def hash(X, C, mprop, bound, spring_support, solve_subset, **options):
+        # Stable hash of the input that defines the results. The options are the other VIBframe
+        # arguments that change the results (mass, solver, target, reduce, footing, point_mass, sparse)
+        h = hashlib.sha1()
+        for a in (X, bound, spring_support):
+            h.update(np.ascontiguousarray(a, dtype=float).tobytes())
+        h.update(np.ascontiguousarray(C, dtype=np.int64).tobytes())
+        props = sorted((p, sorted((k, v if isinstance(v, str) else float(v)) for k, v in d.items())) for p, d in mprop.items())
+        h.update(repr(props).encode())
+        h.update(json.dumps([jsonable(solve_subset), jsonable(options)], sort_keys=True).encode())
+        return h.hexdigest()
+
+    def get(self, key):
+        """
+        Looks up the results of an analysis
+
+        Parameters
+        ----------
+        key : str
+            Hash of the input, from VIBcache.hash
+
+        Returns
+        -------
+        results : dict
+            omega and U (and K and M if cached), or None if the key is not in the cache
+        """
+
+        with closing(self._connect()) as con:
+            row = con.execute("SELECT data FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            con.execute("UPDATE results SET atime = ? WHERE key = ?", (time.time(), key))
+            con.commit()
+
+        self.hits += 1
+        return pickle.loads(row[0])
+
+    def put(self, key, omega, U, K = None, M = None):
+        """
+        Stores the results of an analysis and evicts the least recently used entries if the
+        cache exceeds maxbytes. K and M are only stored if the cache keeps matrices and the entry
+        fits in maxbytes with them. Results larger than maxbytes are not stored (rejected)
+        """
+
+        results = {'omega': omega, 'U': U}
+        data = None
+        if self.matrices:
+            data = pickle.dumps({**results, 'K': K, 'M': M}, protocol=pickle.HIGHEST_PROTOCOL)
+        if data is None or len(data) > self.maxbytes:
+            data = pickle.dumps(results, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.maxbytes:
+            self.rejected += 1
+            warnings.warn(f'Results of {len(data)} bytes exceed the cache size of {self.maxbytes} bytes, not cached')
+            return
+
+        with closing(self._connect()) as con:
+            con.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)", (key, data, len(data), time.time()))
+
+            # Evict the least recently used entries beyond maxbytes
+            total = con.execute("SELECT COALESCE(SUM(nbytes), 0) FROM results").fetchone()[0]
+            if total > self.maxbytes:
+                evict = []
+                for old, nbytes in con.execute("SELECT key, nbytes FROM results ORDER BY atime"):
+                    if total <= self.maxbytes:
+                        break
+                    evict.append((old,))
+                    total -= nbytes
+                con.executemany("DELETE FROM results WHERE key = ?", evict)
+                self.evictions += len(evict)
+            con.commit()
+
+    # Cache statistics
+    def stats(self):
+        with closing(self._connect()) as con:
+            entries, nbytes = con.execute("SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM results").fetchone()
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'rejected': self.rejected,
+                'entries': entries, 'bytes': nbytes, 'maxbytes': self.maxbytes}
+
+    # Empty the cache and reset the counters
+    def clear(self):
+        with closing(self._connect()) as con:
+            con.execute("DELETE FROM results")
+            con.commit()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejected = 0
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
@@ -1,52 +1,198 @@
 import numpy as np
 import sqlite3
+import json
 import os
-from scipy.sparse import lil_matrix
+from contextlib import closing, contextmanager
+from functools import cached_property
+from scipy.sparse import coo_matrix, csr_matrix, triu
+
+# Import functions
+from functions.Mmat.freedofs import freedofs
 
 class VIBdata:
-    def __init__(self, name):
+    def __init__(self, name, run = None):
+        """
+        Results of an analysis stored with basestore. The data is read from the database when an
+        attribute is first used and then kept, so e.g. plotting a mode shape only reads X, C,
+        omega and U. Subsets of the mode shapes can be read with modeshapes.
+
+        Parameters
+        ----------
+        name : str
+            Name of the database
+        run : int or str, optional
+            run_id or content hash of the run to read, see baseruns (default is None, the run stored
+            last, also if its content was already in the database)
+        """
+
         self.db_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + '/' + name
-        self.X = None
-        self.C = None
-        self.mprop = None
-        self.bound = None
-        self.spring_support = None
-        self.ldof = None
-        self.nno = None
-        self.nne = None
-        self.ndof = None
-        self.Mmat = None
-        self.Kmat = None
-        self.omega = None
-        self.U = None
-        
-        self._fetch_data()
-
-    def _fetch_data(self):
-        with sqlite3.connect(self.db_path) as con:
-            cur = con.cursor()
-            self.X = self._fetch_nodes(cur)
-            self.C = self._fetch_connectivity(cur)
-            self.mprop = self._fetch_materials(cur)
-            self.bound = self._fetch_bound(cur)
-            self.spring_support = self._fetch_spring(cur)
-            var = self._fetch_var(cur)
-            self.ldof, self.nno, self.nne, self.ndof = var
-            self.Mmat = self._fetch_Mass(cur)
-            self.Kmat = self._fetch_Stiffness(cur)
-            self.omega = self._fetch_omega(cur)
-            self.U = self._fetch_Displacements(cur)
+
+        # Run to read, all queries are restricted to it
+        with self._cursor() as cur:
+            if run is None:
+                row = cur.execute("SELECT run_id FROM runs ORDER BY created DESC, run_id DESC LIMIT 1").fetchone()
+            elif isinstance(run, str):
+                row = cur.execute("SELECT run_id FROM runs WHERE hash = ?", (run,)).fetchone()
+            else:
+                row = cur.execute("SELECT run_id FROM runs WHERE run_id = ?", (int(run),)).fetchone()
+        if row is None or row[0] is None:
+            raise ValueError(f'Run {run} not found in {name}')
+        self.run_id = row[0]
+
+    @contextmanager
+    def _cursor(self):
+        with closing(sqlite3.connect(self.db_path)) as con:
+            yield con.cursor()
+
+    @cached_property
+    def X(self):
+        with self._cursor() as cur:
+            return self._fetch_nodes(cur)
+
+    @cached_property
+    def C(self):
+        with self._cursor() as cur:
+            return self._fetch_connectivity(cur)
+
+    @cached_property
+    def mprop(self):
+        with self._cursor() as cur:
+            return self._fetch_materials(cur)
+
+    @cached_property
+    def bound(self):
+        with self._cursor() as cur:
+            return self._fetch_bound(cur)
+
+    @cached_property
+    def spring_support(self):
+        with self._cursor() as cur:
+            return self._fetch_spring(cur)
+
+    @cached_property
+    def _var(self):
+        with self._cursor() as cur:
+            return self._fetch_var(cur)
+
+    @property
+    def ldof(self):
+        return self._var[0]
+
+    @property
+    def nno(self):
+        return self._var[1]
+
+    @property
+    def nne(self):
+        return self._var[2]
+
+    @property
+    def ndof(self):
+        return self._var[3]
+
+    @cached_property
+    def df(self):
+        # Free dofs, the rows of U
+        return freedofs(self.bound, self.nno, self.ldof)
+
+    @cached_property
+    def params(self):
+        # Input parameters of the run
+        with self._cursor() as cur:
+            cur.execute("SELECT params FROM runs WHERE run_id = ?", (self.run_id,))
+            return json.loads(cur.fetchone()[0])
+
+    @cached_property
+    def blob(self):
+        # True for the binary storage (basestore with storage='blob')
+        with self._cursor() as cur:
+            cur.execute("SELECT 1 FROM Matrices WHERE run_id = ? LIMIT 1", (self.run_id,))
+            return cur.fetchone() is not None
+
+    @cached_property
+    def Mmat(self):
+        with self._cursor() as cur:
+            return self._fetch_matrix(cur, 'Mass') if self.blob else self._fetch_Mass(cur)
+
+    @cached_property
+    def Kmat(self):
+        with self._cursor() as cur:
+            return self._fetch_matrix(cur, 'Stiffness') if self.blob else self._fetch_Stiffness(cur)
+
+    @cached_property
+    def omega(self):
+        with self._cursor() as cur:
+            return self._fetch_omega(cur)
+
+    @cached_property
+    def U(self):
+        return self.modeshapes()
+
+    def modeshapes(self, modes = None, nodes = None):
+        """
+        Reads a subset of the mode shapes, the selection is done in the database query
+
+        Parameters
+        ----------
+        modes : list, optional
+            Range of mode (column) indices [first, last), 0-based as the columns of U, e.g. [6, 20]
+            (default is None, all modes)
+        nodes : np.array, optional
+            Node numbers (1-based). The rows of all ldof dofs of each node are returned, zero
+            for constrained dofs (default is None, the rows of U, i.e. all free dofs)
+
+        Returns
+        -------
+        U : np.array
+            Mode shapes, shape (number of rows, number of modes)
+        """
+
+        # Mode range, 1-based in the database
+        nmodes = self.omega.size
+        first, last = (0, nmodes) if modes is None else (min(max(modes[0], 0), nmodes), min(modes[1], nmodes))
+        last = max(last, first)
+        if 'U' in self.__dict__:
+            U = self.U[:, first:last]
+            return U if nodes is None else self._noderows(U, nodes)
+
+        # Rows of U (positions among the free dofs) of the requested nodes
+        if nodes is None:
+            rows = np.arange(self.df.size)
+        else:
+            dof = ((np.asarray(nodes, dtype=int)[:, None] - 1)*self.ldof + np.arange(self.ldof)).ravel()
+            rows = np.searchsorted(self.df, dof)
+            free = (rows < self.df.size) & (self.df[np.minimum(rows, self.df.size - 1)] == dof)
+            rows = rows[free]
+
+        with self._cursor() as cur:
+            if self.blob:
+                U = self._fetch_modes(cur, first, last, rows if nodes is not None else None)
+            else:
+                U = self._fetch_Displacements(cur, first, last, rows if nodes is not None else None)
+
+        if nodes is None:
+            return U
+        out = np.zeros((free.size, U.shape[1]))
+        out[free] = U
+        return out
+
+    def _noderows(self, U, nodes):
+        # Rows of the dofs of nodes from mode shapes on the free dofs
+        Uf = np.zeros((self.nno*self.ldof, U.shape[1]))
+        Uf[self.df] = U
+        dof = ((np.asarray(nodes, dtype=int)[:, None] - 1)*self.ldof + np.arange(self.ldof)).ravel()
+        return Uf[dof]
 
     def _fetch_nodes(self, cur):
-        cur.execute("SELECT x, y, z FROM node")
+        cur.execute("SELECT x, y, z FROM node WHERE run_id = ? ORDER BY id", (self.run_id,))
         return np.array(cur.fetchall(), dtype=float)
 
     def _fetch_connectivity(self, cur):
-        cur.execute("SELECT node1, node2, propno FROM connectivity")
+        cur.execute("SELECT node1, node2, propno FROM connectivity WHERE run_id = ? ORDER BY id", (self.run_id,))
         return np.array(cur.fetchall(), dtype=int)
 
     def _fetch_materials(self, cur):
-        cur.execute("SELECT propno, E, A, rho, Iy, Iz, J, G, type FROM material")
+        cur.execute("SELECT propno, E, A, rho, Iy, Iz, J, G, type FROM material WHERE run_id = ?", (self.run_id,))
         return {
             row[0]: {
                 'E': row[1], 'A': row[2], 'rho': row[3],
@@ -57,45 +203,82 @@ class VIBdata:
         }
 
     def _fetch_bound(self, cur):
-        cur.execute("SELECT node, ldof, disp FROM bound")
+        cur.execute("SELECT node, ldof, disp FROM bound WHERE run_id = ?", (self.run_id,))
         return np.array(cur.fetchall(), dtype=float)
 
     def _fetch_spring(self, cur):
-        cur.execute("SELECT node, ldof, Kk FROM spring")
+        cur.execute("SELECT node, ldof, Kk FROM spring WHERE run_id = ?", (self.run_id,))
         return np.array(cur.fetchall(), dtype=float)
 
     def _fetch_var(self, cur):
-        cur.execute("SELECT ldof, nno, nne, ndof FROM var")
+        cur.execute("SELECT ldof, nno, nne, ndof FROM var WHERE id = ?", (self.run_id,))
         return cur.fetchone()
 
     def _fetch_Mass(self, cur):
-        cur.execute("SELECT i, j, m FROM Mass")
-        rows = cur.fetchall()
-        size = max(max(i, j) for i, j, _ in rows)
-        Mmat = lil_matrix((size, size), dtype=float)
-        for i, j, m in rows:
-            Mmat[i - 1, j - 1] = m
-        return Mmat.toarray()
+        cur.execute("SELECT i, j, m FROM Mass WHERE run_id = ?", (self.run_id,))
+        return self._coo(cur.fetchall(), (self.ndof, self.ndof))
 
     def _fetch_Stiffness(self, cur):
-        cur.execute("SELECT i, j, k FROM Stiffness")
-        rows = cur.fetchall()
-        size = max(max(i, j) for i, j, _ in rows)
-        Kmat = lil_matrix((size, size), dtype=float)
-        for i, j, k in rows:
-            Kmat[i - 1, j - 1] = k
-        return Kmat.toarray()
+        cur.execute("SELECT i, j, k FROM Stiffness WHERE run_id = ?", (self.run_id,))
+        return self._coo(cur.fetchall(), (self.ndof, self.ndof))
 
     def _fetch_omega(self, cur):
-        cur.execute("SELECT omega FROM Eigenvalues ORDER BY id")
+        cur.execute("SELECT omega FROM Eigenvalues WHERE run_id = ? ORDER BY id", (self.run_id,))
         return np.array([row[0] for row in cur.fetchall()], dtype=float)
 
-    def _fetch_Displacements(self, cur):
-        cur.execute("SELECT i, j, U FROM Eigenvectors")
-        rows = cur.fetchall()
-        max_i = max(i for i, _, _ in rows)
-        max_j = max(j for _, j, _ in rows)
-        U = lil_matrix((max_i, max_j), dtype=float)
-        for i, j, u in rows:
-            U[i - 1, j - 1] = u
-        return U.toarray()
\ No newline at end of file
+    def _fetch_Displacements(self, cur, first, last, rows = None):
+        # Entries of the modes first..last-1, and of the given rows of U only
+        sql = "SELECT i, j, U FROM Eigenvectors WHERE run_id = ? AND j > ? AND j <= ?"
+        params = [self.run_id, first, last]
+        if rows is not None:
+            sql += f" AND i IN ({','.join('?'*len(rows))})"
+            params += (rows + 1).tolist()
+        cur.execute(sql, params)
+        entries = cur.fetchall()
+
+        if rows is None:
+            return self._coo(entries, (self.df.size, last - first), (0, first))
+        # Renumber the selected rows 1..len(rows), in the order requested
+        position = np.zeros(self.df.size, dtype=int)
+        position[rows] = np.arange(1, rows.size + 1)
+        entries = np.array(entries, dtype=float).reshape(-1, 3)
+        entries[:, 0] = position[entries[:, 0].astype(int) - 1]
+        return self._coo(entries, (rows.size, last - first), (0, first))
+
+    def _coo(self, entries, shape, offset = (0, 0)):
+        # Dense matrix from the (i, j, value) rows (1-based) in one COO construction
+        entries = np.array(entries, dtype=float).reshape(-1, 3)
+        i = entries[:, 0].astype(int) - 1 - offset[0]
+        j = entries[:, 1].astype(int) - 1 - offset[1]
+        return coo_matrix((entries[:, 2], (i, j)), shape=shape).toarray()
+
+    def _fetch_matrix(self, cur, name):
+        # Matrix from its CSR arrays, the BLOBs are read without copying with np.frombuffer
+        cur.execute("SELECT format, nrows, ncols, indptr, indices, data FROM Matrices WHERE run_id = ? AND name = ?",
+                    (self.run_id, name))
+        fmt, nrows, ncols, indptr, indices, data = cur.fetchone()
+        data = np.frombuffer(data, dtype=np.float64)
+        if fmt == 'diag':
+            return np.diag(data)
+        A = csr_matrix((data, np.frombuffer(indices, dtype=np.int32), np.frombuffer(indptr, dtype=np.int64)),
+                       shape=(nrows, ncols))
+        if fmt == 'sym':
+            A = A + triu(A, k=1).T
+        return A.toarray()
+
+    def _fetch_modes(self, cur, first, last, rows = None):
+        # Mode shapes first..last-1. For a subset of rows, only the bytes of the consecutive row
+        # ranges are read from each BLOB (substr)
+        if rows is None:
+            cur.execute("SELECT U FROM Modes WHERE run_id = ? AND j > ? AND j <= ? ORDER BY j", (self.run_id, first, last))
+            cols = [np.frombuffer(u, dtype=np.float64) for (u,) in cur.fetchall()]
+            return np.column_stack(cols) if cols else np.zeros((self.df.size, 0))
+
+        breaks = np.flatnonzero(np.diff(rows) != 1) + 1
+        ranges = [(int(r[0]), int(r.size)) for r in np.split(rows, breaks) if r.size]
+        parts = ", ".join(["substr(U, ?, ?)"]*len(ranges))
+        params = [v for start, n in ranges for v in (8*start + 1, 8*n)]
+        cur.execute(f"SELECT {parts} FROM Modes WHERE run_id = ? AND j > ? AND j <= ? ORDER BY j",
+                    params + [self.run_id, first, last])
+        cols = [np.frombuffer(b"".join(row), dtype=np.float64) for row in cur.fetchall()]
+        return np.column_stack(cols) if cols else np.zeros((rows.size, 0))
@@ -0,0 +1,90 @@
+import numpy as np
+from collections import OrderedDict
+
+# Import functions
+from functions.Kmat.kbeam import kbeam_local
+from functions.Mmat.mbeam import mbeam_local
+
+class VIBelemcache():
+    def __init__(self, maxsize = 10000, decimals = 10):
+        """
+        Memoizing cache for element matrices in local coordinates. Elements with the same property
+        number, length and integration rule share one local stiffness/mass matrix, so only the
+        rotation with Abeam is applied per element. The cache is bounded (least recently used
+        entries are evicted) and can be kept alive across repeated VIBframe runs.
+
+        Parameters
+        ----------
+        maxsize : int, optional
+            Maximum number of local element matrices kept in the cache
+        decimals : int, optional
+            Number of decimals the element length is rounded to in the cache key
+        """
+
+        self.maxsize = maxsize
+        self.decimals = decimals
+
+        # Number of elements served from the cache (hits) and local matrices computed (misses)
+        self.hits = 0
+        self.misses = 0
+
+        self._store = OrderedDict()
+
+    # Local stiffness matrices for a stack of elements, Ge = [E, A, Iz, Iy, G, J]
+    def kbeam(self, L, propno, Ge, PolDeg):
+        return self._lookup('k', kbeam_local, L, propno, Ge, PolDeg)
+
+    # Local mass matrices for a stack of elements, Ge = [A, rho, J]
+    def mbeam(self, L, propno, Ge, PolDeg):
+        return self._lookup('m', mbeam_local, L, propno, Ge, PolDeg)
+
+    # Cache statistics
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._store), 'maxsize': self.maxsize}
+
+    # Empty the cache and reset the counters
+    def clear(self):
+        self._store.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, kind, func, L, propno, Ge, PolDeg):
+        """
+        Looks up the local element matrices of all elements. Elements are grouped on
+        (propno, rounded L) and only groups not already in the cache are computed (batched).
+        The material values are part of the key, so a changed mprop never returns a stale matrix.
+        """
+
+        # Group the elements on property number and rounded length
+        Lr = np.round(L, self.decimals)
+        _, first, inv, count = np.unique(np.column_stack((propno, Lr)), axis=0, return_index=True,
+                                         return_inverse=True, return_counts=True)
+
+        keys = [(kind, int(propno[i]), float(Lr[i]), PolDeg, tuple(float(g[i]) for g in Ge)) for i in first]
+
+        # Collect cached matrices and find the missing groups
+        mats = [None] * len(keys)
+        miss = []
+        for g, key in enumerate(keys):
+            if key in self._store:
+                self._store.move_to_end(key)
+                mats[g] = self._store[key]
+                self.hits += int(count[g])
+            else:
+                miss.append(g)
+
+        # Compute the missing local matrices in one batch
+        if miss:
+            idx = first[miss]
+            new = func(L[idx], [g[idx] for g in Ge], PolDeg)
+            for g, m_l in zip(miss, new):
+                mats[g] = m_l
+                self._store[keys[g]] = m_l
+                self.misses += 1
+                self.hits += int(count[g]) - 1
+
+        # Evict least recently used entries
+        while len(self._store) > self.maxsize:
+            self._store.popitem(last=False)
+
+        return np.stack(mats)[inv.ravel()]
@@ -1,12 +1,26 @@
 import numpy as np
 
 # Import functions
-from functions.Mmat.buildM import buildM
+from functions.Mmat.buildM import buildM, addmass
 from functions.Kmat.buildK import buildK
+from functions.Kmat.buildKM import buildKM
+from functions.Kmat.Abeam import cbeam, rotate
+from functions.Kmat.kbeam import kbeam_local
+from functions.Kmat.assemble import mtable
+from functions.Mmat.mbeam import mbeam_local
+from functions.Mmat.mlump import mlump
 from functions.Mmat.NFA import NFA
+from functions.Mmat.guyan import slavedofs
+from functions.Mmat.freedofs import freedofs
+
+# Import classes
+from classes.VIBplan import VIBplan
+from classes.VIBcache import VIBcache
 
 class VIBframe():
-    def __init__(self, X, C, mprop, bound, spring_support, solve_subset = None):
+    def __init__(self, X, C, mprop, bound, spring_support, solve_subset = None, sparse = False, elemcache = None, plan = None,
+                 workers = None, backend = 'thread', mass = 'consistent', solver = 'auto', target = None,
+                 U0 = None, reduce = None, footing = None, point_mass = None, resultcache = None):
         """
         Vibration analysis program for a 3D frame structure. Calculates the natural 
         frequencies and mode shapes of the structure.
@@ -27,6 +41,46 @@ class VIBframe():
             Array of spring supports
         solve_subset : list, optional
             Subset of eigenvalues (modes) to solve for
+        sparse : bool, optional
+            If True, K and M are assembled as scipy.sparse CSR matrices (default is False)
+        elemcache : VIBelemcache, optional
+            Element matrix cache, can be shared between runs in a parameter study (default is None)
+        plan : VIBplan, optional
+            Assembly plan for the topology, can be shared between runs with the same connectivity.
+            If None, the plan is built from C (default is None)
+        workers : int, optional
+            Number of workers for parallel element assembly. If None, the assembly runs in a
+            single pass (default is None)
+        backend : str, optional
+            Worker pool for parallel assembly, 'thread' for the NumPy kernels or 'process' (default is 'thread')
+        mass : str, optional
+            Mass formulation, 'consistent' or 'lumped'. The lumped (HRZ) mass matrix is stored
+            as a vector with the diagonal of M (default is 'consistent')
+        solver : str, optional
+            Eigensolver, 'dense', 'sparse' (shift-invert Lanczos), 'subspace' (warm-started
+            subspace iteration) or 'auto', which switches to the sparse solver for large models when a
+            subset is requested (default is 'auto')
+        target : float, optional
+            Target natural circular frequency [rad/s] for the sparse solver, the modes closest
+            to the target are found instead of the lowest modes (default is None)
+        U0 : np.array, optional
+            Starting mode shapes for the 'subspace' solver, e.g. U from a model with a nearby design.
+            After an update, the current mode shapes are used (default is None)
+        reduce : str, list or np.array, optional
+            Guyan (static) condensation before the eigen solve. 'internal' condenses the internal
+            nodes of subdivided members, 'rotations' the rotational dofs, or a list of both. User
+            selected slave dofs are given as an array = [node number, dof]. The mode shapes are
+            expanded back to all free dofs (default is None)
+        footing : np.array, optional
+            Node numbers of the footings that carry the additional footing mass. If None, nodes
+            117-120 of the default mesh are used (default is None)
+        point_mass : np.array, optional
+            Array of point masses and inertias, e.g. the RNA, point_mass = [node number, dof, mass].
+            Mass-only changes with update reuse the factorization of K in the sparse solvers (default is None)
+        resultcache : VIBcache, optional
+            Result cache on disk. The input is hashed and, if the same analysis is cached, omega and
+            U (and K and M if the cache keeps matrices) are taken from the cache instead of solving.
+            K and M not in the cache are assembled. New results are added to the cache (default is None)
         """
 
         # Assign input to object
@@ -36,12 +90,26 @@ class VIBframe():
         self.bound = bound
         self.spring_support = spring_support
         self.solve_subset = solve_subset
+        self.sparse = sparse
+        self.elemcache = elemcache
+        self.workers = workers
+        self.backend = backend
+        self.mass = mass
+        self.solver = solver
+        self.target = target
+        self.U0 = U0
+        self.reduce = reduce
+        self.footing = footing
+        self.point_mass = [] if point_mass is None else point_mass
+        self.factor = {}                        # Factorization of K, reused by the sparse solvers
+        self.resultcache = resultcache
 
         # Initialize
         self.ldof = 6                           # Number of dofs per node
         self.nno = np.size(X, 0)                # Total number of nodes
         self.nne = np.size(C, 0)                # Total number of elements
         self.ndof = self.nno * self.ldof        # Total number of dofs
+        self.df = freedofs(bound, self.nno, self.ldof)  # Sorted index of free dofs
 
         # Control if the transition piece is the last type in the dictionary (whether TP is present)
         last_type = None
@@ -50,20 +118,153 @@ class VIBframe():
                 last_type = d['type']
         self.TP = (last_type == 'Transition piece')
 
-        # Run analysis
-        self.buildM()
-        self.buildK()
+        # Assembly plan (scatter map and sparsity pattern) for the topology
+        if plan is None:
+            plan = VIBplan(C, self.nno, self.ldof)
+        elif not plan.matches(C, self.nno, self.ldof):
+            raise ValueError('Assembly plan does not match the topology of the model')
+        self.plan = plan
+
+        # Run analysis, unless the results of the same input are in the result cache
+        self.geometry()
+        if resultcache is not None:
+            self.key = self.hash()
+            cached = resultcache.get(self.key)
+            if cached is not None:
+                self.omega, self.U = cached['omega'], cached['U']
+                self.K, self.M = cached.get('K'), cached.get('M')
+                if self.K is None or self.M is None:
+                    self.buildKM()
+                self.nfa_info = {'solver': 'cache'}
+                self.slavedofs()
+                return
+
+        self.buildKM()
         self.NFA()
+        if resultcache is not None:
+            resultcache.put(self.key, self.omega, self.U, self.K, self.M)
 
     # Functions
+    # Content hash of the input and of all options that change the results (result cache, basestore)
+    def hash(self):
+        return VIBcache.hash(self.X, self.C, self.mprop, self.bound, self.spring_support, self.solve_subset,
+                             sparse=self.sparse, mass=self.mass, solver=self.solver, target=self.target,
+                             reduce=self.reduce, footing=self.footing, point_mass=self.point_mass)
+
+    # Element geometry (direction cosines and length), computed once for the mesh
+    def geometry(self):
+        self.geom = cbeam(self.X[self.C[:,0]-1], self.X[self.C[:,1]-1])
+
+    # Build the system stiffness and mass matrices, K and M, in a single pass
+    def buildKM(self):
+        self.K, self.M, self.geom = buildKM(self.X, self.C, self.mprop, self.spring_support, self.nno, self.nne, self.ldof,
+                                            self.TP, self.sparse, self.elemcache, self.plan, self.geom,
+                                            self.workers, self.backend, mass=self.mass,
+                                            footing=self.footing)
+        self.M = addmass(self.M, self.point_mass, self.ldof, self.sparse, self.plan)
+
     # Build the system mass matrix, M
     def buildM(self):
-        self.M = buildM(self.X, self.C, self.mprop, self.nno, self.nne, self.ldof, self.TP)
+        self.M = buildM(self.X, self.C, self.mprop, self.nno, self.nne, self.ldof, self.TP, self.sparse, self.elemcache, self.plan, self.geom, self.mass,
+                        self.footing)
+        self.M = addmass(self.M, self.point_mass, self.ldof, self.sparse, self.plan)
 
     # Build the system stiffness matrix, K
     def buildK(self):
-        self.K = buildK(self.X, self.C, self.mprop, self.spring_support, self.nno, self.nne, self.ldof)
+        self.K = buildK(self.X, self.C, self.mprop, self.spring_support, self.nno, self.nne, self.ldof, self.sparse, self.elemcache, self.plan, self.geom)
 
     # Solve the eigenvalue problem
     def NFA(self):
-        self.omega, self.U = NFA(self.K, self.M, self.nno, self.ldof, self.bound, self.solve_subset)
\ No newline at end of file
+        self.nfa_info = {}
+        self.slavedofs()
+        self.omega, self.U = NFA(self.K, self.M, self.nno, self.ldof, self.bound, self.solve_subset,
+                                 self.solver, target=self.target, U0=self.U0, info=self.nfa_info,
+                                 slaves=self.slaves, df=self.df, factor=self.factor)
+
+    # Slave dofs (0-based) for the Guyan condensation
+    def slavedofs(self):
+        if self.reduce is None:
+            self.slaves = None
+        elif isinstance(self.reduce, (str, list)):
+            self.slaves = slavedofs(self.X, self.C, self.ldof, self.reduce)
+        else:
+            self.slaves = ((self.reduce[:,0] - 1)*self.ldof + self.reduce[:,1] - 1).astype(int)
+
+    # Update the properties of a subset of elements and solve again
+    def update(self, props = None, elements = None, point_mass = None, solve = True):
+        """
+        Incremental update of K and M when the properties of some elements change. The old
+        element contributions are subtracted and the new ones added in place on the stored
+        system matrices, so the cost scales with the number of changed elements. If only the
+        density and point masses change, K is not touched and the sparse solvers reuse its
+        factorization.
+
+        Parameters
+        ----------
+        props : dict, optional
+            Changed material properties per property number, e.g. {3: {'E': 180e9}}.
+            New property numbers can be added the same way (with all properties given)
+        elements : dict, optional
+            New property number per element number (1-based), e.g. {12: 5}
+        point_mass : np.array, optional
+            New point masses, replacing the current ones, point_mass = [node number, dof, mass]
+        solve : bool, optional
+            If True, the eigenvalue problem is solved again (default is True)
+        """
+
+        props = {} if props is None else props
+        elements = {} if elements is None else elements
+
+        # New material dictionary and connectivity (the input objects are not modified)
+        mprop = {p: dict(d) for p, d in self.mprop.items()}
+        for p, d in props.items():
+            mprop.setdefault(p, {}).update(d)
+        C = self.C.copy()
+        for e, p in elements.items():
+            C[e - 1, 2] = p
+
+        # Elements with changed property values or reassigned property number
+        changed = np.isin(self.C[:,2], list(props)) | np.isin(C[:,2], list(props)) | (C[:,2] != self.C[:,2])
+        idx = np.flatnonzero(changed)
+
+        if idx.size > 0:
+            # Change of the local element matrices
+            k_old, m_old = self._local(self.mprop, self.C, idx)
+            k_new, m_new = self._local(mprop, C, idx)
+
+            # Transform to global coordinates and add the change in place (K does not depend on rho)
+            c = self.geom[0][idx]
+            if elements or any(k != 'rho' for d in props.values() for k in d):
+                self.K = self.plan.scatter(self.K, idx, rotate(c, k_new - k_old))
+            if self.mass == 'lumped':
+                np.add.at(self.M, self.plan.de[idx], mlump(m_new, c) - mlump(m_old, c))
+            else:
+                self.M = self.plan.scatter(self.M, idx, rotate(c, m_new - m_old))
+
+        # Replace the point masses
+        if point_mass is not None:
+            if np.any(self.point_mass):
+                removed = np.array(self.point_mass, dtype=float)
+                removed[:,2] *= -1
+                self.M = addmass(self.M, removed, self.ldof, self.sparse, self.plan)
+            self.M = addmass(self.M, point_mass, self.ldof, self.sparse, self.plan)
+            self.point_mass = point_mass
+
+        self.mprop = mprop
+        self.C = C
+
+        if solve:
+            # Warm start from the current modes (used by the 'subspace' solver)
+            self.U0 = self.U
+            self.NFA()
+
+    # Local element stiffness and mass matrices for a subset of elements
+    def _local(self, mprop, C, idx):
+        propno = C[idx, 2]
+        L = self.geom[1][idx]
+        Gk = mtable(mprop, propno, ['E', 'A', 'Iz', 'Iy', 'G', 'J'])
+        Gm = mtable(mprop, propno, ['A', 'rho', 'J'])
+
+        if self.elemcache is None:
+            return kbeam_local(L, Gk, 3), mbeam_local(L, Gm, 6)
+        return self.elemcache.kbeam(L, propno, Gk, 3), self.elemcache.mbeam(L, propno, Gm, 6)
@@ -0,0 +1,182 @@
+import numpy as np
+import hashlib
+from scipy.sparse import csr_matrix
+
+# Import functions
+from functions.Kmat.assemble import edof, assemble
+
+class VIBplan():
+    def __init__(self, C, nno, ldof = 6):
+        """
+        Assembly plan for a fixed topology. Precomputes the element degrees of freedom, the CSR
+        sparsity pattern of the system matrices and the position of every element matrix entry
+        in the CSR data array. Assembling K or M with the plan is then a single data-array fill.
+        The plan only depends on the connectivity (not on X or mprop), so it can be reused for
+        all design variants sharing the mesh, and saved to disk to be reused across processes.
+
+        Parameters
+        ----------
+        C : np.array
+            Array of element connectivity and assignment of material properties
+        nno : int
+            Total number of nodes
+        ldof : int, optional
+            Number of dofs per node
+        """
+
+        self.nno = int(nno)
+        self.ldof = int(ldof)
+        self.ndof = self.nno * self.ldof
+        self.key = VIBplan.topology(C, nno, ldof)
+
+        # Element degrees of freedom (0-based), shape (nne, 12)
+        self.de = edof(C, self.ldof)
+        nen = self.de.shape[1]
+
+        # Linear index of every element matrix entry, row-major within each element
+        rows = np.repeat(self.de, nen, axis=1).ravel()
+        cols = np.tile(self.de, (1, nen)).ravel()
+        lin, pos = np.unique(rows.astype(np.int64)*self.ndof + cols, return_inverse=True)
+
+        # CSR sparsity pattern (sorted by row, then column)
+        self.indices = (lin % self.ndof).astype(np.int32)
+        self.indptr = np.searchsorted(lin // self.ndof, np.arange(self.ndof + 1)).astype(np.int32)
+        self.nnz = lin.size
+
+        # Position in the CSR data array for each element matrix entry, shape (nne, 144)
+        self.map = pos.reshape(self.de.shape[0], nen*nen)
+
+        # Position of the diagonal entries in the CSR data array (-1 if not in the pattern)
+        self.diag = np.full(self.ndof, -1, dtype=np.int64)
+        on_diag = (lin // self.ndof) == (lin % self.ndof)
+        self.diag[lin[on_diag] // self.ndof] = np.flatnonzero(on_diag)
+
+    @staticmethod
+    def topology(C, nno, ldof = 6):
+        # Hash of the element node pairs and problem size, property numbers do not change the plan
+        h = hashlib.sha1(np.ascontiguousarray(C[:, 0:2], dtype=np.int64).tobytes())
+        h.update(np.array([nno, ldof], dtype=np.int64).tobytes())
+        return h.hexdigest()
+
+    # Check if the plan can be used for the given topology
+    def matches(self, C, nno, ldof = 6):
+        return self.key == VIBplan.topology(C, nno, ldof)
+
+    def assemble(self, ke, sparse = False):
+        """
+        Assembles a stack of element matrices with the precomputed scatter map
+
+        Parameters
+        ----------
+        ke : np.array
+            Element matrices in global coordinates, shape (nne, 12, 12)
+        sparse : bool, optional
+            If True, a scipy.sparse CSR matrix is returned (default is False)
+
+        Returns
+        -------
+        Kmat : np.array or scipy.sparse.csr_matrix
+            System matrix
+        """
+
+        data = np.bincount(self.map.ravel(), weights=ke.ravel(), minlength=self.nnz)
+
+        if sparse:
+            # The index arrays are copied, so the matrix does not share them with the plan or other matrices
+            Kmat = csr_matrix((data, self.indices.copy(), self.indptr.copy()), shape=(self.ndof, self.ndof))
+            Kmat.has_sorted_indices = True
+            return Kmat
+
+        Kmat = np.zeros((self.ndof, self.ndof))
+        Kmat[np.repeat(np.arange(self.ndof), np.diff(self.indptr)), self.indices] = data
+        return Kmat
+
+    def scatter(self, Kmat, elements, ke):
+        """
+        Adds element matrices of a subset of elements to a system matrix assembled with the
+        plan (in place). Used for incremental updates, where ke holds the change of the
+        element matrices.
+
+        Parameters
+        ----------
+        Kmat : np.array or scipy.sparse.csr_matrix
+            System matrix
+        elements : np.array
+            Element indices (0-based)
+        ke : np.array
+            Element matrices in global coordinates, shape (len(elements), 12, 12)
+
+        Returns
+        -------
+        Kmat : np.array or scipy.sparse.csr_matrix
+            System matrix
+        """
+
+        elements = np.asarray(elements, dtype=int)
+
+        if not isinstance(Kmat, np.ndarray):
+            if Kmat.nnz == self.nnz:
+                np.add.at(Kmat.data, self.map[elements].ravel(), ke.ravel())
+                return Kmat
+            # The structure no longer follows the plan, add as a separate sparse matrix
+            return Kmat + assemble(ke, self.de[elements], self.ndof, sparse=True)
+
+        de = self.de[elements]
+        nen = de.shape[1]
+        np.add.at(Kmat, (np.repeat(de, nen, axis=1).ravel(), np.tile(de, (1, nen)).ravel()), ke.ravel())
+        return Kmat
+
+    def adddiag(self, Kmat, dof, values):
+        """
+        Adds values to diagonal entries of a system matrix assembled with the plan (in place)
+
+        Parameters
+        ----------
+        Kmat : np.array or scipy.sparse.csr_matrix
+            System matrix
+        dof : np.array
+            Degrees of freedom (0-based)
+        values : np.array
+            Values added to the diagonal entries
+
+        Returns
+        -------
+        Kmat : np.array or scipy.sparse.csr_matrix
+            System matrix
+        """
+
+        dof = np.asarray(dof, dtype=int)
+        values = np.broadcast_to(np.asarray(values, dtype=float), dof.shape)
+
+        if not isinstance(Kmat, np.ndarray):
+            pos = self.diag[dof]
+            if np.all(pos >= 0):
+                np.add.at(Kmat.data, pos, values)
+                return Kmat
+            # Diagonal entries outside the pattern change the structure
+            return Kmat + csr_matrix((values, (dof, dof)), shape=Kmat.shape)
+
+        np.add.at(Kmat, (dof, dof), values)
+        return Kmat
+
+    def save(self, filename):
+        # Save the plan to a .npz file
+        np.savez(filename, key=self.key, nno=self.nno, ldof=self.ldof, de=self.de, indices=self.indices,
+                 indptr=self.indptr, map=self.map, diag=self.diag)
+
+    @classmethod
+    def load(cls, filename):
+        # Load a plan saved with save
+        with np.load(filename) as f:
+            plan = cls.__new__(cls)
+            plan.key = str(f['key'])
+            plan.nno = int(f['nno'])
+            plan.ldof = int(f['ldof'])
+            plan.ndof = plan.nno * plan.ldof
+            plan.de = f['de']
+            plan.indices = f['indices']
+            plan.indptr = f['indptr']
+            plan.nnz = plan.indices.size
+            plan.map = f['map']
+            plan.diag = f['diag']
+        return plan
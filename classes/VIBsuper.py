@@ -0,0 +1,248 @@
+import numpy as np
+import hashlib
+import os
+from scipy import linalg
+from scipy.sparse import csr_matrix, diags
+from scipy.sparse.linalg import eigsh, splu, LinearOperator
+
+# Import functions
+from functions.Kmat.buildKM import buildKM
+from functions.Kmat.kspring import kspring
+from functions.Kmat.Abeam import cbeam, rotate
+from functions.Kmat.kbeam import kbeam_local
+from functions.Kmat.assemble import edof, mtable, assemble, assemblediag
+from functions.Mmat.mbeam import mbeam_local
+from functions.Mmat.mlump import mlump
+from functions.Mmat.freedofs import freedofs
+
+class VIBsuper():
+    def __init__(self, X, C, mprop, interface, nmodes = 20, bound = None, spring_support = None,
+                 mass = 'consistent', footing = None, cachedir = None):
+        """
+        Craig-Bampton superelement of a substructure, typically the jacket (the model without
+        the transition piece). The substructure is reduced to the dofs of the interface nodes and
+        a set of fixed-interface modes. The reduced matrices only depend on the input of the
+        substructure, so they can be cached on disk and coupled with a changing top structure
+        (transition piece, tower, RNA mass) with couple.
+
+        Parameters
+        ----------
+        X : np.array
+            Array of node coordinates of the substructure
+        C : np.array
+            Array of element connectivity and assignment of material properties of the substructure
+        mprop : dict
+            Dictionary with material properties
+        interface : np.array
+            Interface node numbers (1-based), where the top structure is connected
+        nmodes : int, optional
+            Number of fixed-interface modes kept in the superelement (default is 20)
+        bound : np.array, optional
+            Nodal boundary conditions of the substructure (default is None)
+        spring_support : np.array, optional
+            Spring supports of the substructure (default is None)
+        mass : str, optional
+            Mass formulation, 'consistent' or 'lumped' (default is 'consistent')
+        footing : np.array, optional
+            Node numbers of the footings that carry the additional footing mass. If None, nodes
+            117-120 of the default mesh are used (default is None)
+        cachedir : str, optional
+            Directory for the cached reduced matrices. If a superelement with the same input is
+            found, it is loaded instead of reduced again (default is None, no caching)
+        """
+
+        self.X = X
+        self.C = C
+        self.mprop = mprop
+        self.interface = np.asarray(interface, dtype=int)
+        self.nmodes = int(nmodes)
+        self.bound = [] if bound is None else bound
+        self.spring_support = [] if spring_support is None else spring_support
+        self.mass = mass
+        self.footing = None if footing is None else np.asarray(footing, dtype=int)
+
+        self.ldof = 6
+        self.nno = np.size(X, 0)
+        self.nne = np.size(C, 0)
+        self.key = VIBsuper.hash(X, C, mprop, self.interface, self.nmodes, self.bound, self.spring_support, mass,
+                                 self.footing)
+
+        filename = None if cachedir is None else os.path.join(cachedir, f'CB_{self.key}.npz')
+        self.cached = filename is not None and os.path.exists(filename)
+
+        if self.cached:
+            self.load(filename)
+        else:
+            self.reduce()
+            if filename is not None:
+                self.save(filename)
+
+    @staticmethod
+    def hash(X, C, mprop, interface, nmodes, bound, spring_support, mass, footing = None):
+        # Hash of all input that defines the reduced matrices
+        h = hashlib.sha1()
+        for a in (X, bound, spring_support):
+            h.update(np.ascontiguousarray(a, dtype=float).tobytes())
+        for a in (C, interface):
+            h.update(np.ascontiguousarray(a, dtype=np.int64).tobytes())
+        props = sorted((p, sorted((k, float(v)) for k, v in d.items() if k != 'type')) for p, d in mprop.items())
+        feet = None if footing is None else np.asarray(footing, dtype=int).tolist()
+        h.update(repr((props, nmodes, mass, feet)).encode())
+        return h.hexdigest()
+
+    def reduce(self):
+        """
+        Craig-Bampton reduction. The free dofs are split in boundary dofs b (interface nodes)
+        and internal dofs i, and u = T [u_b, q] with T = [[I, 0], [Psi, Phi]], where
+        Psi = -Kii^-1 Kib are the constraint modes and Phi the mass-normalized fixed-interface modes.
+        """
+
+        K, M, _ = buildKM(self.X, self.C, self.mprop, self.spring_support, self.nno, self.nne, self.ldof,
+                          sparse=True, mass=self.mass, footing=self.footing)
+        M = diags(M, format='csr') if M.ndim == 1 else M
+
+        # Free dofs of the substructure and position of the boundary/internal dofs among them
+        self.df = freedofs(self.bound, self.nno, self.ldof)
+        self.b = (self.interface[:, None] - 1)*self.ldof + np.arange(self.ldof)
+        self.b = self.b.ravel()
+        ib = np.searchsorted(self.df, self.b)
+        ii = np.setdiff1d(np.arange(self.df.size), ib)
+        if self.nmodes >= ii.size:
+            raise ValueError('Number of fixed-interface modes exceeds the number of internal dofs')
+
+        K = K[self.df][:, self.df].tocsr()
+        M = M[self.df][:, self.df].tocsr()
+        Kii, Kib, Kbb = K[ii][:, ii].tocsc(), K[ii][:, ib].toarray(), K[ib][:, ib].toarray()
+        Mii, Mib, Mbb = M[ii][:, ii], M[ii][:, ib].toarray(), M[ib][:, ib].toarray()
+
+        # Constraint modes, Kii is factorized once and reused for the fixed-interface modes
+        lu = splu(Kii)
+        Psi = -lu.solve(Kib)
+
+        # Fixed-interface modes (mass-normalized), shift-invert about zero
+        OPinv = LinearOperator(Kii.shape, matvec=lu.solve, dtype=float)
+        lam, Phi = eigsh(Kii, k=self.nmodes, M=Mii, sigma=0, which='LM', OPinv=OPinv)
+        order = np.argsort(lam)
+        self.lam, Phi = lam[order], Phi[:, order]
+
+        # Reduced matrices, Kr = [[Kbb_hat, 0], [0, diag(lam)]], Mr = [[Mbb_hat, Mbq], [Mbq^T, I]]
+        nb = ib.size
+        MiiPsi = Mii @ Psi
+        Mbb_hat = Mbb + Psi.T @ Mib + Mib.T @ Psi + Psi.T @ MiiPsi
+        Mbq = (Mib.T + MiiPsi.T) @ Phi
+
+        self.Kr = np.zeros((nb + self.nmodes, nb + self.nmodes))
+        self.Kr[:nb, :nb] = Kbb + Kib.T @ Psi
+        self.Kr[nb:, nb:] = np.diag(self.lam)
+        self.Kr = (self.Kr + self.Kr.T)/2
+
+        self.Mr = np.eye(nb + self.nmodes)
+        self.Mr[:nb, :nb] = (Mbb_hat + Mbb_hat.T)/2
+        self.Mr[:nb, nb:] = Mbq
+        self.Mr[nb:, :nb] = Mbq.T
+
+        # Transformation from [u_b, q] to the free dofs of the substructure
+        self.T = np.zeros((self.df.size, nb + self.nmodes))
+        self.T[ib, np.arange(nb)] = 1.0
+        self.T[np.ix_(ii, np.arange(nb))] = Psi
+        self.T[ii, nb:] = Phi
+
+    def couple(self, X, C, mprop, bound = None, spring_support = None, point_mass = None, solve_subset = None):
+        """
+        Couples the superelement with a top structure and solves the eigenvalue problem of the
+        assembled system. The nodes of the substructure keep their numbers in the coupled model
+        (as in indata, where the transition piece is appended to the jacket).
+
+        Parameters
+        ----------
+        X : np.array
+            Node coordinates of the coupled model, the first nodes are the nodes of the substructure
+        C : np.array
+            Connectivity of the top structure elements only. The elements may connect to the
+            interface nodes and to nodes numbered after the substructure nodes
+        mprop : dict
+            Dictionary with material properties of the top structure elements
+        bound : np.array, optional
+            Nodal boundary conditions of the top structure nodes (default is None)
+        spring_support : np.array, optional
+            Spring supports on the interface and top structure nodes (default is None)
+        point_mass : np.array, optional
+            Point masses and inertias on the interface and top structure nodes (e.g. the RNA),
+            point_mass = [node number, dof, mass] (default is None)
+        solve_subset : list, optional
+            Subset of eigenvalues (modes) to solve for (default is None)
+
+        Returns
+        -------
+        omega : np.array
+            Natural frequencies
+        U : np.array
+            Mode shapes on the free dofs of the coupled model (substructure and top structure
+            boundary conditions removed), normalized for max displacement of +1
+        """
+
+        nno = np.size(X, 0)
+        ndof = nno*self.ldof
+        if not np.allclose(X[:self.nno], self.X):
+            raise ValueError('Node coordinates do not match the substructure of the superelement')
+        inner = np.setdiff1d(np.arange(1, self.nno + 1), self.interface)
+        if np.isin(C[:, 0:2], inner).any():
+            raise ValueError('Top structure elements must only connect to the interface nodes of the substructure')
+
+        # Stiffness and mass matrices of the top structure elements
+        c, L = cbeam(X[C[:,0]-1], X[C[:,1]-1])
+        k_l = kbeam_local(L, mtable(mprop, C[:,2], ['E', 'A', 'Iz', 'Iy', 'G', 'J']), 3)
+        m_l = mbeam_local(L, mtable(mprop, C[:,2], ['A', 'rho', 'J']), 6)
+        de = edof(C, self.ldof)
+        Kt = assemble(rotate(c, k_l), de, ndof, sparse=True)
+        if self.mass == 'lumped':
+            Mt = diags(assemblediag(mlump(m_l, c), de, ndof), format='csr')
+        else:
+            Mt = assemble(rotate(c, m_l), de, ndof, sparse=True)
+
+        if spring_support is not None and np.any(spring_support):
+            Kt = Kt + kspring(spring_support, nno, self.ldof, sparse=True)
+        if point_mass is not None and np.any(point_mass):
+            dof = ((point_mass[:,0] - 1)*self.ldof + point_mass[:,1] - 1).astype(int)
+            Mt = Mt + csr_matrix((point_mass[:,2], (dof, dof)), shape=(ndof, ndof))
+
+        # Coupled dofs: boundary dofs, free top structure dofs and modal coordinates
+        bound = [] if bound is None else bound
+        t = freedofs(bound, nno, self.ldof)
+        t = t[t >= self.nno*self.ldof]
+        g = np.concatenate((self.b, t))
+        nb, nt = self.b.size, t.size
+        sb = np.concatenate((np.arange(nb), nb + nt + np.arange(self.nmodes)))
+
+        Kc = np.zeros((nb + nt + self.nmodes,)*2)
+        Mc = np.zeros_like(Kc)
+        Kc[:nb + nt, :nb + nt] = Kt[g][:, g].toarray()
+        Mc[:nb + nt, :nb + nt] = Mt[g][:, g].toarray()
+        Kc[np.ix_(sb, sb)] += self.Kr
+        Mc[np.ix_(sb, sb)] += self.Mr
+
+        D, V = linalg.eigh(Kc, Mc, subset_by_index = solve_subset)
+
+        # Expand the mode shapes to the free dofs of the coupled model
+        U = np.vstack((self.T @ V[sb], V[nb:nb + nt]))
+
+        # Normalize mode shape for max displacement of +1
+        U /= np.where(np.abs(U).max(axis=0) != 0, np.abs(U).max(axis=0), 1.0)
+
+        return np.sqrt(D).real, U
+
+    def save(self, filename):
+        # Save the reduced matrices to a .npz file
+        np.savez(filename, key=self.key, Kr=self.Kr, Mr=self.Mr, T=self.T, df=self.df, b=self.b, lam=self.lam)
+
+    def load(self, filename):
+        # Load the reduced matrices saved with save
+        with np.load(filename) as f:
+            if str(f['key']) != self.key:
+                raise ValueError('Cached superelement does not match the input')
+            self.Kr = f['Kr']
+            self.Mr = f['Mr']
+            self.T = f['T']
+            self.df = f['df']
+            self.b = f['b']
+            self.lam = f['lam']
@@ -0,0 +1,284 @@
+import numpy as np
+import hashlib
+import itertools
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Import functions
+from functions.indata.indata import indata
+from functions.indata.mprop import mprop as buildmprop
+from functions.Mmat.mac import pairmodes
+from functions.data.utils import jsonable
+
+# Import classes
+from classes.VIBframe import VIBframe
+from classes.VIBplan import VIBplan
+from classes.VIBelemcache import VIBelemcache
+
+class VIBsweep():
+    def __init__(self, base, cases = None, grid = None, name = 'VIB_Sweep.db', workers = None, solve_subset = [0, 25],
+                 bound = None, spring_support = None, options = None, reference = None):
+        """
+        Design study engine. Runs many jacket variants (indata, mprop and VIBframe per case) in a
+        process pool. Cases with the same mesh topology (nn_levels, nne_per_beam, TP) share one
+        assembly plan, each worker keeps its own element matrix cache, and the natural frequencies
+        are stored in a results database as the cases complete. Cases already in the database
+        are skipped, so an interrupted study is resumed by running it again.
+
+        Parameters
+        ----------
+        base : dict
+            Default input of all cases: width_mudline, width_top, height, nn_levels, nne_per_beam,
+            TP, dim_brace, dim_leg, E, G and rho (as in EX1.1). A single [outer diameter, thickness]
+            row for dim_brace/dim_leg is used for all levels. If G is not given, G = E/(2*(1 + 0.29))
+        cases : list, optional
+            List of dictionaries with the input that changes per case (default is None)
+        grid : dict, optional
+            Lists of values per input, all combinations are run (default is None)
+        name : str, optional
+            Name of the results database (default is 'VIB_Sweep.db')
+        workers : int, optional
+            Number of worker processes. If 1, the cases are run in the calling process (default is None, all cores)
+        solve_subset : list, optional
+            Subset of eigenvalues (modes) to solve for (default is [0, 25])
+        bound : np.array or callable, optional
+            Nodal boundary conditions, or a function bound(case, footing) returning them for the
+            mesh of a case, where footing are the footing node numbers. With a process pool the
+            function must be defined at module level, so it can be pickled (default is None)
+        spring_support : np.array or callable, optional
+            Spring supports, or a function spring_support(case, footing) (default is None)
+        options : dict, optional
+            Additional keyword arguments for VIBframe, e.g. {'sparse': True} (default is None)
+        reference : VIBframe, optional
+            Solved reference model for mode tracking. The modes of each case with the same free
+            dofs are paired with the reference modes by MAC (pairmodes), and stored in the order
+            of the reference modes with their MAC value, so a mode keeps its number across all
+            cases when close modes cross. Other cases are stored in solver order (default is None)
+        """
+
+        self.base = base
+        self.workers = workers
+        self.solve_subset = solve_subset
+        self.bound = bound
+        self.spring_support = spring_support
+        self.options = {} if options is None else options
+        self.reference = None if reference is None else (np.asarray(reference.omega), np.asarray(reference.U))
+        self.db_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + '/' + name
+
+        # Cases from the sample list and/or the parameter grid
+        cases = [] if cases is None else list(cases)
+        if grid is not None:
+            keys = list(grid)
+            cases += [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+        self.cases = [{**base, **case} for case in cases]
+
+    @staticmethod
+    def hash(case, solve_subset, options, reference = None, bound = None, spring_support = None):
+        # Hash of the input of a case, used to skip cases already in the database. bound and
+        # spring_support are the arrays of the case (callables resolved)
+        h = hashlib.sha1(json.dumps([jsonable(case), solve_subset, jsonable(options)], sort_keys=True).encode())
+        for a in (bound, spring_support):
+            a = np.asarray([] if a is None else a, dtype=float)
+            h.update(repr(a.shape).encode())
+            h.update(np.ascontiguousarray(a).tobytes())
+        if reference is not None:
+            h.update(np.ascontiguousarray(reference[1]).tobytes())
+        return h.hexdigest()
+
+    def run(self):
+        """
+        Runs all cases not yet in the results database
+
+        Returns
+        -------
+        stats : dict
+            Number of cases run, skipped (already done) and failed, and the wall time
+        """
+
+        t0 = time.time()
+        con = sqlite3.connect(self.db_path)
+        self._tables(con)
+
+        # Skip the cases already completed (failed cases are run again)
+        done = {row[0] for row in con.execute("SELECT hash FROM cases WHERE error IS NULL")}
+        todo = {h: case for h, case in zip(self._hashes(), self.cases) if h not in done}
+
+        # One assembly plan per topology, built once and shared by all workers
+        plans = {}
+        for case in todo.values():
+            topo = _topology(case)
+            if topo not in plans:
+                X, C = indata(case['width_mudline'], case['width_top'], case['height'], *topo)
+                plans[topo] = VIBplan(C, X.shape[0])
+
+        # Submit the cases grouped by topology, so the element caches of the workers are reused
+        jobs = sorted(todo.items(), key=lambda item: _topology(item[1]))
+        args = (self.solve_subset, self.bound, self.spring_support, self.options)
+        stats = {'run': 0, 'skipped': len(self.cases) - len(todo), 'failed': 0}
+
+        if self.workers == 1:
+            _init(plans, self.reference)
+            results = (_case(h, case, *args) for h, case in jobs)
+            for result in results:
+                self._store(con, result, stats)
+        else:
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=_init, initargs=(plans, self.reference)) as pool:
+                futures = [pool.submit(_case, h, case, *args) for h, case in jobs]
+                for future in as_completed(futures):
+                    self._store(con, future.result(), stats)
+
+        con.close()
+        stats['time'] = time.time() - t0
+        return stats
+
+    def results(self, mac = False):
+        """
+        Reads the completed cases of the study from the results database
+
+        Parameters
+        ----------
+        mac : bool, optional
+            If True, the MAC values with the reference modes are returned as well (default is False)
+
+        Returns
+        -------
+        cases : list
+            Input of each case (dictionaries)
+        omega : np.array
+            Natural frequencies, shape (number of cases, number of modes)
+        values : np.array
+            MAC value of each mode with the paired reference mode, NaN if not paired (only if mac is True)
+        """
+
+        with sqlite3.connect(self.db_path) as con:
+            self._tables(con)
+            rows = con.execute("SELECT hash, params FROM cases WHERE error IS NULL ORDER BY rowid").fetchall()
+            hashes = set(self._hashes())
+            rows = [(h, params) for h, params in rows if h in hashes]
+            cases = [json.loads(params) for _, params in rows]
+            freq = [con.execute("SELECT omega, mac FROM frequencies WHERE hash = ? ORDER BY mode", (h,)).fetchall()
+                    for h, _ in rows]
+        omega = np.array([[w for w, _ in f] for f in freq], dtype=float)
+        if mac:
+            return cases, omega, np.array([[m for _, m in f] for f in freq], dtype=float)
+        return cases, omega
+
+    def _hashes(self):
+        # Hash of each case, with the boundary conditions and spring supports of the case
+        hashes = []
+        for case in self.cases:
+            try:
+                b, s = _supports(case, self.bound, self.spring_support)
+            except Exception:
+                # The case fails (and stores the error) when it is run
+                b = s = None
+            hashes.append(VIBsweep.hash(case, self.solve_subset, self.options, self.reference, b, s))
+        return hashes
+
+    def _tables(self, con):
+        con.execute("""
+        CREATE TABLE IF NOT EXISTS cases (
+            hash TEXT PRIMARY KEY,
+            params TEXT NOT NULL,
+            nno INTEGER,
+            nne INTEGER,
+            seconds REAL,
+            error TEXT
+        )
+        """)
+        con.execute("""
+        CREATE TABLE IF NOT EXISTS frequencies (
+            hash TEXT NOT NULL,
+            mode INTEGER NOT NULL,
+            omega REAL,
+            mac REAL,
+            PRIMARY KEY (hash, mode)
+        )
+        """)
+        # Databases from before mode tracking have no mac column
+        if 'mac' not in [row[1] for row in con.execute("PRAGMA table_info(frequencies)")]:
+            con.execute("ALTER TABLE frequencies ADD COLUMN mac REAL")
+        con.commit()
+
+    def _store(self, con, result, stats):
+        # Store one case as it completes, committed at once so the study can be resumed
+        h, case, nno, nne, seconds, omega, values, error = result
+        con.execute("DELETE FROM frequencies WHERE hash = ?", (h,))
+        con.execute("INSERT OR REPLACE INTO cases VALUES (?, ?, ?, ?, ?, ?)",
+                    (h, json.dumps(jsonable(case), sort_keys=True), nno, nne, seconds, error))
+        if error is None:
+            first = self.solve_subset[0] if self.solve_subset else 0
+            con.executemany("INSERT INTO frequencies (hash, mode, omega, mac) VALUES (?, ?, ?, ?)",
+                            [(h, first + i, float(w), None if np.isnan(m) else float(m))
+                             for i, (w, m) in enumerate(zip(omega, values))])
+            stats['run'] += 1
+        else:
+            stats['failed'] += 1
+        con.commit()
+
+def footing(nn_levels, nne_per_beam):
+    # Footing (pile bottom) node numbers of the mesh from indata, the first nodes after the jacket nodes
+    nno_max = (4 + 8*nn_levels) + (nne_per_beam - 1)*20*nn_levels
+    return np.arange(nno_max + 1, nno_max + 5)
+
+# Worker state: assembly plans per topology, an element matrix cache per process and the reference modes
+_plans = {}
+_cache = None
+_reference = None
+
+def _init(plans, reference = None):
+    global _plans, _cache, _reference
+    _plans = plans
+    _cache = VIBelemcache()
+    _reference = reference
+
+def _topology(case):
+    return (int(case['nn_levels']), int(case['nne_per_beam']), bool(case.get('TP', False)))
+
+def _supports(case, bound, spring_support):
+    # Boundary conditions and spring supports of a case, functions of the case and its footing nodes
+    feet = footing(*_topology(case)[:2])
+    b = bound(case, feet) if callable(bound) else bound
+    s = spring_support(case, feet) if callable(spring_support) else spring_support
+    return b, s
+
+def _case(h, case, solve_subset, bound, spring_support, options):
+    # Runs one case in a worker, errors are returned and stored with the case
+    t0 = time.time()
+    try:
+        nn_levels, nne_per_beam, TP = _topology(case)
+        dim_brace = np.atleast_2d(np.asarray(case['dim_brace'], dtype=float))
+        dim_leg = np.atleast_2d(np.asarray(case['dim_leg'], dtype=float))
+        dim_brace = np.repeat(dim_brace, nn_levels, axis=0) if dim_brace.shape[0] == 1 else dim_brace
+        dim_leg = np.repeat(dim_leg, nn_levels, axis=0) if dim_leg.shape[0] == 1 else dim_leg
+        E = case['E']
+        G = case.get('G', E/(2*(1 + 0.29)))
+
+        mprop = buildmprop(nn_levels, dim_brace, dim_leg, E, G, case['rho'], TP)
+        X, C = indata(case['width_mudline'], case['width_top'], case['height'], nn_levels, nne_per_beam, TP)
+
+        feet = footing(nn_levels, nne_per_beam)
+        b, s = _supports(case, bound, spring_support)
+
+        Model = VIBframe(X, C, mprop, [] if b is None else b, [] if s is None else s, solve_subset,
+                         elemcache=_cache, plan=_plans.get((nn_levels, nne_per_beam, TP)), footing=feet, **options)
+        omega, values = _track(Model.omega, Model.U)
+        return h, case, Model.nno, Model.nne, time.time() - t0, omega, values, None
+
+    except Exception as e:
+        return h, case, None, None, time.time() - t0, None, None, f'{type(e).__name__}: {e}'
+
+def _track(omega, U):
+    # Frequencies in the order of the paired reference modes and their MAC values (NaN if not paired)
+    values = np.full(len(omega), np.nan)
+    if _reference is None or _reference[1].shape[0] != U.shape[0]:
+        return omega, values
+    pairs, _, macs = pairmodes(_reference[0], _reference[1], omega, U)
+    tracked = np.full(len(_reference[0]), np.nan)
+    tracked[pairs[:,0]] = omega[pairs[:,1]]
+    values = np.full(len(_reference[0]), np.nan)
+    values[pairs[:,0]] = macs
+    return tracked, values
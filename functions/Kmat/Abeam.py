@@ -2,23 +2,53 @@ import numpy as np
 
 def Abeam(n1, n2):
     """
-    Function calculates the transformation matrix abar for a single element \n
+    Function calculates the transformation matrix abar for a single element or a stack of elements \n
     Note: There is a special case when the xl || z - In this case the cross product will be zero, and yl is calculated as the following:
     yl = 0i + 1j + 0k
 
     Parameters
     ----------
     n1 : np.array
-        nodal coordinates for start node of element (GLOB)
+        nodal coordinates for start node of element (GLOB), shape (3,) or (nne, 3)
     n2 : np.array
-        nodal coordinates for end node of element (GLOB)
+        nodal coordinates for end node of element (GLOB), shape (3,) or (nne, 3)
     
     Returns
     -------
     A : np.array
-        Transformation matrix for element
-    L : float
-        Length of element
+        Transformation matrix for element, shape (12, 12) or (nne, 12, 12)
+    L : float or np.array
+        Length of element, scalar or shape (nne,)
+    """
+
+    # Direction cosines and length
+    c, L = cbeam(n1, n2)
+
+    # Create the elements transformation matrix (block diagonal with c)
+    A = np.zeros(np.shape(L) + (12, 12))
+    for b in range(4):
+        A[..., 3*b:3*b + 3, 3*b:3*b + 3] = c
+    
+    return A, L
+
+def cbeam(n1, n2):
+    """
+    Function calculates the 3x3 direction cosine matrix c = [xl; yl; zl] and the length of a
+    single element or a stack of elements. The transformation matrix A is block diagonal with c.
+
+    Parameters
+    ----------
+    n1 : np.array
+        nodal coordinates for start node of element (GLOB), shape (3,) or (nne, 3)
+    n2 : np.array
+        nodal coordinates for end node of element (GLOB), shape (3,) or (nne, 3)
+    
+    Returns
+    -------
+    c : np.array
+        Direction cosine matrix for element, shape (3, 3) or (nne, 3, 3)
+    L : float or np.array
+        Length of element, scalar or shape (nne,)
     """
 
     # Preallocate the z(global) vector
@@ -26,24 +56,39 @@ def Abeam(n1, n2):
 
     # Find the x,y,z (local)
     x = n2 - n1
-    xl = x / np.linalg.norm(x)
+    L = np.linalg.norm(x, axis=-1)
+    xl = x / L[..., None]
 
-    # Use np.allclose to compare vectors
-    # Special case: np.cross(z, xl) = 0
-    if np.allclose(abs(xl), z):
-        y = np.array([0.0, 1.0, 0.0])
-    else:
-        y = np.cross(z, xl)
+    # Special case: np.cross(z, xl) = 0 (same tolerance as np.allclose)
+    vertical = np.all(np.isclose(abs(xl), z), axis=-1)
+    y = np.where(vertical[..., None], np.array([0.0, 1.0, 0.0]), np.cross(z, xl))
 
-    yl = y / np.linalg.norm(y)
+    yl = y / np.linalg.norm(y, axis=-1)[..., None]
     zl = np.cross(xl, yl)
 
-    # Create the elements transformation matrix
-    c = np.stack((xl, yl, zl))
-    A = np.block([[c, np.zeros((3, 3)), np.zeros((3, 3)), np.zeros((3, 3))],
-                  [np.zeros((3, 3)), c, np.zeros((3, 3)), np.zeros((3, 3))],
-                  [np.zeros((3, 3)), np.zeros((3, 3)), c, np.zeros((3, 3))],
-                  [np.zeros((3, 3)), np.zeros((3, 3)), np.zeros((3, 3)), c]])
-    L = np.linalg.norm(x)
-    
-    return A, L
\ No newline at end of file
+    c = np.stack((xl, yl, zl), axis=-2)
+
+    return c, L
+
+def rotate(c, k_l):
+    """
+    Transforms element matrices from local to global coordinates, k = A^T k_l A. The block
+    diagonal structure of A is used, so only 3x3 rotations are applied to each of the 4x4 blocks.
+
+    Parameters
+    ----------
+    c : np.array
+        Direction cosine matrix for element, shape (3, 3) or (nne, 3, 3)
+    k_l : np.array
+        Element matrix in local coordinates, shape (..., 12, 12), broadcast against c
+
+    Returns
+    -------
+    k : np.array
+        Element matrix in global coordinates, shape (..., 12, 12)
+    """
+
+    k_b = k_l.reshape(k_l.shape[:-2] + (4, 3, 4, 3))
+    k = np.einsum('...ji,...ajbk,...kl->...aibl', c, k_b, c, optimize=True)
+
+    return k.reshape(k_l.shape)
@@ -6,11 +6,13 @@ def Bint(s, L):
    ----------
    s : float
       Local coordinate (interpolation point)
+   L : float or np.array
+      Length of element, scalar or shape (nne,)
 
    Returns
    -------
    B : np.array
-      Strain interpolation matrix
+      Strain interpolation matrix, shape (4, 12) or (nne, 4, 12)
    """
    
    # Functions defined for interpolation matrix
@@ -22,9 +24,10 @@ def Bint(s, L):
    B6 = (1 + 3*s)/L
 
    # Build strain interpolation matrix
-   B = np.array([[B1, 0,  0,  0,  0,  0,  B4, 0,  0,  0,  0,  0 ],
-                 [0,  B2, 0,  0,  0,  B3, 0,  B5, 0,  0,  0,  B6],
-                 [0,  0,  B2, 0, -B3, 0,  0,  0,  B5, 0, -B6, 0 ],
-                 [0,  0,  0,  B1, 0,  0,  0,  0,  0,  B4, 0,  0 ]])
+   B = np.zeros(np.shape(L) + (4, 12))
+   B[..., 0, 0], B[..., 0, 6] = B1, B4
+   B[..., 1, 1], B[..., 1, 5], B[..., 1, 7], B[..., 1, 11] = B2, B3, B5, B6
+   B[..., 2, 2], B[..., 2, 4], B[..., 2, 8], B[..., 2, 10] = B2, -B3, B5, -B6
+   B[..., 3, 3], B[..., 3, 9] = B1, B4
    
-   return B
\ No newline at end of file
+   return B
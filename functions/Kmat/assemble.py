@@ -0,0 +1,97 @@
+import numpy as np
+from scipy.sparse import coo_matrix
+
+def edof(C, ldof):
+    """
+    Degrees of freedom of all elements from the connectivity matrix
+
+    Parameters
+    ----------
+    C : np.array
+        Connectivity matrix
+    ldof : int
+        Number of degrees of freedom per node
+
+    Returns
+    -------
+    de : np.array
+        Element degrees of freedom (0-based), shape (nne, 2*ldof)
+    """
+
+    node_dofs = np.arange(ldof)
+    return np.hstack(((C[:, 0:1] - 1)*ldof + node_dofs, (C[:, 1:2] - 1)*ldof + node_dofs))
+
+def mtable(mprop, propno, keys):
+    """
+    Material properties of all elements as arrays, looked up once per property number
+
+    Parameters
+    ----------
+    mprop : dict
+        Dictionary with element properties
+    propno : np.array
+        Property number of each element, i.e. C[:,2]
+    keys : list
+        Names of the properties to collect, e.g. ['E', 'A']
+
+    Returns
+    -------
+    Ge : list
+        List of arrays of shape (nne,), one for each key
+    """
+
+    props, inv = np.unique(propno, return_inverse=True)
+    table = np.array([[mprop[p][key] for key in keys] for p in props], dtype=float)
+    return list(table[inv.ravel()].T)
+
+def assemble(ke, de, ndof, sparse=False):
+    """
+    Assembles a stack of element matrices into the system matrix
+
+    Parameters
+    ----------
+    ke : np.array
+        Element matrices in global coordinates, shape (nne, 12, 12)
+    de : np.array
+        Element degrees of freedom (0-based), shape (nne, 12)
+    ndof : int
+        Total number of degrees of freedom
+    sparse : bool, optional
+        If True, the system matrix is returned as a scipy.sparse CSR matrix (default is False)
+
+    Returns
+    -------
+    Kmat : np.array or scipy.sparse.csr_matrix
+        System matrix
+    """
+
+    nen = de.shape[1]
+    rows = np.repeat(de, nen, axis=1).ravel()
+    cols = np.tile(de, (1, nen)).ravel()
+
+    if sparse:
+        return coo_matrix((ke.ravel(), (rows, cols)), shape=(ndof, ndof)).tocsr()
+
+    # Duplicate entries are summed by bincount on the flattened index
+    return np.bincount(rows*ndof + cols, weights=ke.ravel(), minlength=ndof*ndof).reshape(ndof, ndof)
+
+def assemblediag(me, de, ndof):
+    """
+    Assembles a stack of diagonal element matrices into the diagonal of the system matrix
+
+    Parameters
+    ----------
+    me : np.array
+        Diagonal of the element matrices in global coordinates, shape (nne, 12)
+    de : np.array
+        Element degrees of freedom (0-based), shape (nne, 12)
+    ndof : int
+        Total number of degrees of freedom
+
+    Returns
+    -------
+    Mvec : np.array
+        Diagonal of the system matrix, shape (ndof,)
+    """
+
+    return np.bincount(de.ravel(), weights=me.ravel(), minlength=ndof)
@@ -1,8 +1,10 @@
 import numpy as np
-from functions.Kmat.kbeam import kbeam
+from functions.Kmat.Abeam import cbeam, rotate
+from functions.Kmat.kbeam import kbeam_local
 from functions.Kmat.kspring import kspring
+from functions.Kmat.assemble import edof, mtable, assemble
 
-def buildK(X, C, mprop, spring_support, nno, nne, ldof):
+def buildK(X, C, mprop, spring_support, nno, nne, ldof, sparse=False, cache=None, plan=None, geom=None):
     """
     Builds the system stiffness matrix from element stiffness matrices
 
@@ -22,38 +24,80 @@ def buildK(X, C, mprop, spring_support, nno, nne, ldof):
         Number of elements
     ldof : int
         Number of degrees of freedom per node
+    sparse : bool, optional
+        If True, the element contributions are collected as triplets and the system
+        matrix is returned as a scipy.sparse CSR matrix (default is False)
+    cache : VIBelemcache, optional
+        Element matrix cache. If given, local element matrices are looked up in the cache
+        and only rotated per element (default is None)
+    plan : VIBplan, optional
+        Assembly plan for the topology. If given, the precomputed scatter map and sparsity
+        pattern are used for the assembly (default is None)
+    geom : tuple, optional
+        Element geometry (c, L) from cbeam for all elements. If None, it is computed from X (default is None)
     
     Returns
     --------
-    Kmat : np.array
+    Kmat : np.array or scipy.sparse.csr_matrix
         System stiffness matrix in global coordinates
     """
 
-    # Initialize K matrix
-    Kmat = np.zeros((nno*ldof,nno*ldof))
+    # Element geometry (direction cosines and length) for all elements
+    if geom is None:
+        geom = cbeam(X[C[:,0]-1], X[C[:,1]-1])
+    c, L = geom
 
-    # Loop over elements
-    for i in range(nne):
-        # Define element properties
-        propno = C[i,2]
-        Ge = [mprop[propno]['E'], mprop[propno]['A'], mprop[propno]['Iz'], mprop[propno]['Iy'], mprop[propno]['G'], mprop[propno]['J']]
+    # Element properties for all elements
+    Ge = mtable(mprop, C[:,2], ['E', 'A', 'Iz', 'Iy', 'G', 'J'])
 
-        # Define element coordinates
-        n1 = X[C[i,0]-1]
-        n2 = X[C[i,1]-1]
+    # Local element stiffness matrices for all elements at once, shape (nne, 12, 12)
+    if cache is None:
+        k_l = kbeam_local(L, Ge, 3)
+    else:
+        k_l = cache.kbeam(L, C[:,2], Ge, 3)
 
-        # Define element stiffness matrix
-        k = kbeam(n1,n2,Ge,3)
+    # Transform to global coordinates
+    k = rotate(c, k_l)
 
-        # Define element degrees of freedom
-        de = np.array([6*C[i,0]-5, 6*C[i,0]-4, 6*C[i,0]-3, 6*C[i,0]-2, 6*C[i,0]-1, 6*C[i,0],
-                       6*C[i,1]-5, 6*C[i,1]-4, 6*C[i,1]-3, 6*C[i,1]-2, 6*C[i,1]-1, 6*C[i,1]])
+    # Add element stiffness matrices to system stiffness matrix
+    if plan is None:
+        Kmat = assemble(k, edof(C, ldof), nno*ldof, sparse)
+    else:
+        Kmat = plan.assemble(k, sparse)
 
-        # Add element stiffness matrix to system stiffness matrix
-        Kmat[np.ix_(de - 1, de - 1)] += k
+    return addspring(Kmat, spring_support, nno, ldof, sparse, plan)
+
+def addspring(Kmat, spring_support, nno, ldof, sparse=False, plan=None):
+    """
+    Adds the spring supports to the system stiffness matrix
+
+    Parameters
+    -----------
+    Kmat : np.array or scipy.sparse.csr_matrix
+        System stiffness matrix
+    spring_support : np.array
+        Spring support matrix = [nodeno, dof, stiffness]
+    nno : int
+        Number of nodes
+    ldof : int
+        Number of degrees of freedom per node
+    sparse : bool, optional
+        If True, Kmat is a scipy.sparse CSR matrix (default is False)
+    plan : VIBplan, optional
+        Assembly plan used to assemble Kmat (default is None)
+
+    Returns
+    --------
+    Kmat : np.array or scipy.sparse.csr_matrix
+        System stiffness matrix including spring supports
+    """
 
     if np.any(spring_support):
-        Kkmat = kspring(spring_support, nno, ldof)
-        Kmat += Kkmat
+        if plan is None:
+            Kkmat = kspring(spring_support, nno, ldof, sparse)
+            Kmat += Kkmat
+        else:
+            dof = ((spring_support[:,0] - 1)*ldof + spring_support[:,1] - 1).astype(int)
+            Kmat = plan.adddiag(Kmat, dof, spring_support[:,2])
     
     return Kmat
\ No newline at end of file
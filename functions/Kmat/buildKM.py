@@ -0,0 +1,207 @@
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from scipy.sparse import csr_matrix
+from functions.Kmat.Abeam import cbeam, rotate
+from functions.Kmat.kbeam import kbeam_local
+from functions.Kmat.buildK import addspring
+from functions.Kmat.assemble import edof, mtable, assemble, assemblediag
+from functions.Mmat.mbeam import mbeam_local
+from functions.Mmat.buildM import addfooting
+from functions.Mmat.mlump import mlump
+
+def buildKM(X, C, mprop, spring_support, nno, nne, ldof, TP=False, sparse=False, cache=None, plan=None, geom=None,
+            workers=None, backend='thread', chunksize=2048, mass='consistent', footing=None):
+    """
+    Builds the system stiffness and mass matrices in a single pass. The element geometry
+    (direction cosines and length) is computed once and shared by both matrices, and the
+    local element matrices are transformed together with blockwise 3x3 rotations.
+
+    Parameters
+    -----------
+    X : np.array
+        Nodal coordinates
+    C : np.array
+        Connectivity matrix
+    mprop : dict
+        Dictionary with element properties
+    spring_support : np.array
+        Spring support matrix
+    nno : int
+        Number of nodes
+    nne : int
+        Number of elements
+    ldof : int
+        Number of degrees of freedom per node
+    TP : bool, optional
+        If True, the additional mass and inertia is added to the mass matrix (default is False)
+    sparse : bool, optional
+        If True, the system matrices are returned as scipy.sparse CSR matrices (default is False)
+    cache : VIBelemcache, optional
+        Element matrix cache for the local element matrices (default is None)
+    plan : VIBplan, optional
+        Assembly plan for the topology (default is None)
+    geom : tuple, optional
+        Element geometry (c, L) from cbeam for all elements. If None, it is computed from X (default is None)
+    workers : int, optional
+        Number of workers for parallel assembly. If None, the elements are assembled in a single
+        pass in the calling thread (default is None)
+    backend : str, optional
+        Worker pool used for parallel assembly, 'thread' or 'process' (default is 'thread')
+    chunksize : int, optional
+        Number of elements per chunk in parallel assembly. The chunks do not depend on the number
+        of workers, so the result is identical for any worker count (default is 2048)
+    mass : str, optional
+        Mass formulation, 'consistent' or 'lumped' (HRZ lumping, default is 'consistent')
+    footing : np.array, optional
+        Node numbers of the footings (1-based). If None, nodes 117-120 of the default mesh are used (default is None)
+
+    Returns
+    --------
+    Kmat : np.array or scipy.sparse.csr_matrix
+        System stiffness matrix in global coordinates
+    Mmat : np.array or scipy.sparse.csr_matrix
+        System consistent mass matrix in global coordinates. For the lumped formulation the
+        diagonal of the mass matrix is returned as a vector of shape (ndof,)
+    geom : tuple
+        Element geometry (c, L) used for the assembly
+    """
+
+    # Element geometry (direction cosines and length) for all elements, computed once
+    if geom is None:
+        geom = cbeam(X[C[:,0]-1], X[C[:,1]-1])
+    c, L = geom
+
+    # Element properties for all elements
+    Gk = mtable(mprop, C[:,2], ['E', 'A', 'Iz', 'Iy', 'G', 'J'])
+    Gm = mtable(mprop, C[:,2], ['A', 'rho', 'J'])
+
+    if workers is not None:
+        Kmat, Mmat = _parallelKM(c, L, C[:,2], Gk, Gm, nno*ldof, sparse, cache, plan, C, ldof, workers, backend, chunksize, mass)
+        Kmat = addspring(Kmat, spring_support, nno, ldof, sparse, plan)
+        Mmat = addfooting(Mmat, sparse, plan, footing)
+        return Kmat, Mmat, geom
+
+    # Local element stiffness and mass matrices, shape (nne, 12, 12)
+    if cache is None:
+        k_l = kbeam_local(L, Gk, 3)
+        m_l = mbeam_local(L, Gm, 6)
+    else:
+        k_l = cache.kbeam(L, C[:,2], Gk, 3)
+        m_l = cache.mbeam(L, C[:,2], Gm, 6)
+
+    # Transform to global coordinates, stiffness and consistent mass in one go
+    if mass == 'lumped':
+        k = rotate(c, k_l)
+        m = mlump(m_l, c)
+    else:
+        k, m = rotate(c, np.stack((k_l, m_l)))
+
+    # Add element matrices to system matrices
+    de = edof(C, ldof) if plan is None else plan.de
+    if plan is None:
+        Kmat = assemble(k, de, nno*ldof, sparse)
+    else:
+        Kmat = plan.assemble(k, sparse)
+
+    if mass == 'lumped':
+        Mmat = assemblediag(m, de, nno*ldof)
+    elif plan is None:
+        Mmat = assemble(m, de, nno*ldof, sparse)
+    else:
+        Mmat = plan.assemble(m, sparse)
+
+    # Spring supports and additional masses
+    Kmat = addspring(Kmat, spring_support, nno, ldof, sparse, plan)
+    Mmat = addfooting(Mmat, sparse, plan, footing)
+
+    return Kmat, Mmat, geom
+
+def chunkKM(c, L, Gk, Gm, k_l, m_l, emap, de=None, mass='consistent'):
+    """
+    Assembles the contribution of one chunk of elements to the CSR data arrays of K and M. Only
+    the positions the chunk touches are returned, with the entries summed per position
+
+    Parameters
+    -----------
+    c : np.array
+        Direction cosine matrices of the chunk, shape (n, 3, 3)
+    L : np.array
+        Element lengths of the chunk, shape (n,)
+    Gk : list
+        Stiffness properties of the chunk, list = [E, A, Iz, Iy, G, J]
+    Gm : list
+        Mass properties of the chunk, list = [A, rho, J]
+    k_l : np.array or None
+        Local stiffness matrices of the chunk if already known (e.g. from a cache)
+    m_l : np.array or None
+        Local mass matrices of the chunk if already known (e.g. from a cache)
+    emap : np.array
+        Position in the CSR data array for each element matrix entry, shape (n, 144)
+    de : np.array, optional
+        Element degrees of freedom of the chunk, needed for the lumped mass formulation
+    mass : str, optional
+        Mass formulation, 'consistent' or 'lumped' (default is 'consistent')
+
+    Returns
+    --------
+    k_part : tuple
+        (positions, values) in the CSR data array of K, positions unique and sorted
+    m_part : tuple
+        (positions, values) in the CSR data array of M, or in the diagonal of M (dofs) if lumped
+    """
+
+    if k_l is None:
+        k_l = kbeam_local(L, Gk, 3)
+        m_l = mbeam_local(L, Gm, 6)
+
+    if mass == 'lumped':
+        k = rotate(c, k_l)
+        m_part = _compact(de, mlump(m_l, c))
+    else:
+        k, m = rotate(c, np.stack((k_l, m_l)))
+        m_part = _compact(emap, m)
+
+    return _compact(emap, k), m_part
+
+def _compact(pos, values):
+    # Unique positions and the values summed per position
+    pos, inv = np.unique(pos.ravel(), return_inverse=True)
+    return pos, np.bincount(inv.ravel(), weights=values.ravel(), minlength=pos.size)
+
+def _parallelKM(c, L, propno, Gk, Gm, ndof, sparse, cache, plan, C, ldof, workers, backend, chunksize, mass):
+    # Parallel assembly: the elements are split in fixed chunks, each chunk is assembled in a
+    # worker pool into the positions of the CSR data arrays it touches, and these are added to
+    # the data arrays in chunk order, which makes the result independent of the number of workers.
+    if plan is None:
+        # The partial data arrays need the scatter map of an assembly plan
+        from classes.VIBplan import VIBplan
+        plan = VIBplan(C, ndof // ldof, ldof)
+
+    # Local element matrices from the cache are looked up in the calling thread
+    k_l = m_l = None
+    if cache is not None:
+        k_l = cache.kbeam(L, propno, Gk, 3)
+        m_l = cache.mbeam(L, propno, Gm, 6)
+
+    chunks = [slice(i, i + chunksize) for i in range(0, L.size, chunksize)]
+    args = [(c[s], L[s], [g[s] for g in Gk], [g[s] for g in Gm],
+             None if k_l is None else k_l[s], None if m_l is None else m_l[s], plan.map[s],
+             plan.de[s], mass) for s in chunks]
+
+    Pool = ThreadPoolExecutor if backend == 'thread' else ProcessPoolExecutor
+    k_data = np.zeros(plan.nnz)
+    m_data = np.zeros(ndof if mass == 'lumped' else plan.nnz)
+    with Pool(max_workers=workers) as pool:
+        for (k_pos, k_part), (m_pos, m_part) in pool.map(chunkKM, *zip(*args)):
+            np.add.at(k_data, k_pos, k_part)
+            np.add.at(m_data, m_pos, m_part)
+
+    return _fromdata(k_data, plan, sparse), (m_data if mass == 'lumped' else _fromdata(m_data, plan, sparse))
+
+def _fromdata(data, plan, sparse):
+    # System matrix from a CSR data array following the sparsity pattern of the plan
+    if sparse:
+        return csr_matrix((data, plan.indices.copy(), plan.indptr.copy()), shape=(plan.ndof, plan.ndof))
+    Kmat = np.zeros((plan.ndof, plan.ndof))
+    Kmat[np.repeat(np.arange(plan.ndof), np.diff(plan.indptr)), plan.indices] = data
+    return Kmat
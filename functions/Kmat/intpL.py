@@ -1,4 +1,4 @@
-import numpy as np
+from functions.Kmat.quadrature import gauss
 
 def intpL(PolDeg=None):
     """
@@ -7,7 +7,8 @@ def intpL(PolDeg=None):
     Parameters
     ----------
     PolDeg : int
-        Polynomial degree of the integration rule
+        Polynomial degree of the integration rule (any degree, the rule with
+        PolDeg//2 + 1 points integrates it exactly)
 
     Returns
     -------
@@ -17,27 +18,7 @@ def intpL(PolDeg=None):
         Integration weights
     """
 
-    if PolDeg <= 1:
-        xip = np.array([0])
-        wip = np.array([2])
-    
-    elif PolDeg <= 3:
-        xip = np.array([-0.577350269189626, 0.577350269189626])
-        wip = np.array([1, 1])
+    if PolDeg is None:
+        raise ValueError("PolDeg not specified")
 
-    elif PolDeg <= 5:
-        xip = np.array([-0.774596669241483, 0, 0.774596669241483])
-        wip = np.array([0.555555555555556, 0.888888888888889, 0.555555555555556])
-
-    elif PolDeg <= 7:
-        xip = np.array([-0.861136311594053, -0.339981043584856, 0.339981043584856, 0.861136311594053])
-        wip = np.array([0.347854845137454, 0.652145154862546, 0.652145154862546, 0.347854845137454])
-
-    elif PolDeg <= 9:
-        xip = np.array([-0.906179845938664, -0.538469310105683, 0, 0.538469310105683, 0.906179845938664])
-        wip = np.array([0.236926885056189, 0.478628670499366, 0.568888888888889, 0.478628670499366, 0.236926885056189])
-    
-    else:
-        raise ValueError("PolDeg too high or note specified")
-    
-    return xip, wip
\ No newline at end of file
+    return gauss(max(int(PolDeg), 1)//2 + 1)
@@ -1,21 +1,22 @@
 import numpy as np
-from functions.Kmat.Abeam import Abeam
+from functions.Kmat.Abeam import cbeam, rotate
 from functions.Kmat.intpL import intpL
-from functions.Kmat.Bint import Bint
+from functions.Kmat.quadrature import Btable
 
 
 def kbeam(n1, n2, Ge, PolDeg):
     """
-    Builds local stiffnes matrix from element properties
+    Builds local stiffnes matrix from element properties. All inputs may be stacked along a
+    leading element axis, in which case the stiffness matrices of all elements are built at once.
 
     Parameters
     -----------
     n1 : np.array
-        Coordinate for node 1
+        Coordinate for node 1, shape (3,) or (nne, 3)
     n2 : np.array
-        Coordinate for node 2
+        Coordinate for node 2, shape (3,) or (nne, 3)
     Ge : list
-        Material properies for element 
+        Material properies for element (floats or arrays of shape (nne,))
         list = [E, A, Iz, Iy, G, J]
     PolDeg : int
         Polynomial degree 
@@ -23,11 +24,41 @@ def kbeam(n1, n2, Ge, PolDeg):
     Returns
     --------
     k : np.array
-        Local stiffness matrix for element
+        Local stiffness matrix for element, shape (12, 12) or (nne, 12, 12)
     """
     
-    # Define length and transformation matrix
-    A, L = Abeam(n1, n2)
+    # Define length and direction cosines
+    c, L = cbeam(n1, n2)
+
+    # Local stiffness matrix
+    k_l = kbeam_local(L, Ge, PolDeg)
+
+    # Transform to global coordinates
+    k = rotate(c, k_l)
+    
+    return k
+
+
+def kbeam_local(L, Ge, PolDeg):
+    """
+    Builds the element stiffness matrix in local coordinates. Inputs may be stacked along a
+    leading element axis.
+
+    Parameters
+    -----------
+    L : float or np.array
+        Length of element, scalar or shape (nne,)
+    Ge : list
+        Material properies for element (floats or arrays of shape (nne,))
+        list = [E, A, Iz, Iy, G, J]
+    PolDeg : int
+        Polynomial degree 
+
+    Returns
+    --------
+    k_l : np.array
+        Stiffness matrix for element in local coordinates, shape (12, 12) or (nne, 12, 12)
+    """
 
     # Gauss-Legrendre interpolation points
     xip, wip = intpL(PolDeg)
@@ -35,19 +66,15 @@ def kbeam(n1, n2, Ge, PolDeg):
     # Jacobi function
     J = L/2
 
-    # Init. material matrix
-    D = np.array([[Ge[0]*Ge[1], 0, 0, 0],
-                  [0, Ge[0]*Ge[2], 0, 0],
-                  [0, 0, Ge[0]*Ge[3], 0],
-                  [0, 0, 0, Ge[4]*Ge[5]]])
-    
-    # Initialize k for element in local coordinates
-    k_l = np.zeros((12,12))
-    
-    for i in range(len(xip)):
-        B = Bint(xip[i],L)
-        k_l += B.T @ D @ B * wip[i] * J
-    
-    k = A.T @ k_l @ A
+    # Init. material matrix (diagonal entries)
+    D = np.stack(np.broadcast_arrays(Ge[0]*Ge[1], Ge[0]*Ge[2], Ge[0]*Ge[3], Ge[4]*Ge[5]), axis=-1)
+
+    # Strain interpolation at all Gauss points, scaled from the precomputed tables, shape (..., nip, 4, 12)
+    B1, B2 = Btable(len(xip))
+    Lr = np.asarray(L)[..., None, None, None]
+    B = B1/Lr + B2/Lr**2
     
-    return k
\ No newline at end of file
+    # Element stiffness matrix in local coordinates, all Gauss points and elements at once
+    k_l = np.einsum('...pri,...r,...prj,p->...ij', B, D, B, wip, optimize=True) * np.asarray(J)[..., None, None]
+
+    return k_l
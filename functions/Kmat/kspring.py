@@ -1,6 +1,7 @@
 import numpy as np
+from scipy.sparse import csr_matrix
 
-def kspring(spring_support, nno, ldof):
+def kspring(spring_support, nno, ldof, sparse=False):
     """
     Calculate the stiffness matrix for the spring support.
 
@@ -12,13 +13,19 @@ def kspring(spring_support, nno, ldof):
         Number of nodes
     ldof : int
         Number of degrees of freedom per node
+    sparse : bool, optional
+        If True, the stiffness matrix is returned as a scipy.sparse CSR matrix (default is False)
 
     Returns
     --------
-    Kkmat : np.array
+    Kkmat : np.array or scipy.sparse.csr_matrix
         Stiffness matrix for spring support
     """
 
+    if sparse:
+        dof = ((spring_support[:,0] - 1)*ldof + spring_support[:,1] - 1).astype(int)
+        return csr_matrix((spring_support[:,2], (dof, dof)), shape=(nno*ldof,nno*ldof))
+
     # Initialize stiffness matrix
     Kkmat = np.zeros((nno*ldof,nno*ldof))
 
@@ -0,0 +1,98 @@
+import numpy as np
+from functools import lru_cache
+from functions.Kmat.Bint import Bint
+from functions.Mmat.Nint import Nint
+
+@lru_cache(maxsize=None)
+def gauss(npoints):
+    """
+    Gauss-Legendre quadrature rule with an arbitrary number of points. The rules are cached,
+    so each rule is only generated once.
+
+    Parameters
+    ----------
+    npoints : int
+        Number of integration points (integrates polynomials up to degree 2*npoints - 1 exactly)
+
+    Returns
+    -------
+    xip : np.array
+        Integration points
+    wip : np.array
+        Integration weights
+    """
+
+    if npoints < 1:
+        raise ValueError("Number of integration points must be at least 1")
+
+    xip, wip = np.polynomial.legendre.leggauss(npoints)
+    xip.setflags(write=False)
+    wip.setflags(write=False)
+
+    return xip, wip
+
+@lru_cache(maxsize=None)
+def Btable(npoints):
+    """
+    L-independent parts of the strain interpolation matrix at the points of a Gauss-Legendre rule.
+    The strain interpolation is B(s, L) = B1(s)/L + B2(s)/L**2, so element kernels only scale
+    the tables with the element length.
+
+    Parameters
+    ----------
+    npoints : int
+        Number of integration points
+
+    Returns
+    -------
+    B1 : np.array
+        Part of B scaled by 1/L, shape (npoints, 4, 12)
+    B2 : np.array
+        Part of B scaled by 1/L**2, shape (npoints, 4, 12)
+    """
+
+    xip, _ = gauss(npoints)
+
+    # Separate the two parts from the interpolation evaluated at L = 1 and L = 2
+    Ba = np.array([Bint(s, 1.0) for s in xip])
+    Bb = np.array([Bint(s, 2.0) for s in xip])
+    B2 = 2*(Ba - 2*Bb)
+    B1 = Ba - B2
+
+    B1.setflags(write=False)
+    B2.setflags(write=False)
+
+    return B1, B2
+
+@lru_cache(maxsize=None)
+def Ntable(npoints):
+    """
+    L-independent parts of the shape function matrix at the points of a Gauss-Legendre rule.
+    The shape functions are N(s, L) = N0(s) + L*N1(s), so element kernels only scale the
+    tables with the element length.
+
+    Parameters
+    ----------
+    npoints : int
+        Number of integration points
+
+    Returns
+    -------
+    N0 : np.array
+        Part of N independent of L, shape (npoints, 4, 12)
+    N1 : np.array
+        Part of N scaled by L, shape (npoints, 4, 12)
+    """
+
+    xip, _ = gauss(npoints)
+
+    # Separate the two parts from the shape functions evaluated at L = 1 and L = 2
+    Na = np.array([Nint(s, 1.0) for s in xip])
+    Nb = np.array([Nint(s, 2.0) for s in xip])
+    N1 = Nb - Na
+    N0 = Na - N1
+
+    N0.setflags(write=False)
+    N1.setflags(write=False)
+
+    return N0, N1
@@ -1,23 +1,64 @@
 import numpy as np
+import hashlib
 from scipy import linalg
+from scipy.sparse import issparse, csr_matrix, diags
+from scipy.sparse.linalg import eigsh, splu, cg, LinearOperator
+from functions.Mmat.guyan import guyan
+from functions.Mmat.freedofs import freedofs
 
-def NFA(K, M, nno, ldof, bound, solve_subset=None):
+def NFA(K, M, nno, ldof, bound, solve_subset=None, solver='auto', threshold=2000, target=None,
+        U0=None, tol=1e-6, maxiter=100, info=None, slaves=None, df=None,
+        factor=None):
     """
     Natural frequency analysis program for a 3D frame structure. Solves the eigenvalue problem
     for the system stiffness and mass matrices, taking into account nodal boundary conditions.
 
     Parameters
     ----------
-    K : np.array
+    K : np.array or scipy.sparse matrix
         System stiffness matrix
-    M : np.array
-        System mass matrix
+    M : np.array or scipy.sparse matrix
+        System mass matrix, or its diagonal as a vector of shape (ndof,) for a lumped mass matrix
     nno : int
         Total number of nodes
     bound : np.array
         Nodal boundary conditions
     solve_subset : list, optional
         Subset of eigenvalues to solve for
+    solver : str, optional
+        Eigensolver: 'dense' (scipy.linalg.eigh), 'sparse' (shift-invert Lanczos with a sparse LU
+        factorization, scipy.sparse.linalg.eigsh), 'subspace' (subspace iteration started from U0,
+        for continuation in parameter sweeps) or 'auto', which uses the sparse solver when a
+        subset is requested and the number of free dofs exceeds threshold (default is 'auto')
+    threshold : int, optional
+        Number of free dofs above which 'auto' switches to the sparse solver (default is 2000)
+    target : float, optional
+        Target natural circular frequency [rad/s] for the sparse solver. If given, the modes
+        closest to the target (in terms of omega**2) are found (spectrum slicing) instead of the
+        lowest modes. The number of modes is given by solve_subset (default is None)
+    U0 : np.array, optional
+        Starting block for the 'subspace' solver, typically the mode shapes U of a previous run
+        with the same free dofs. Missing columns are filled with random vectors (default is None)
+    tol : float, optional
+        Relative residual tolerance for the 'subspace' solver (default is 1e-6)
+    maxiter : int, optional
+        Maximum number of iterations for the 'subspace' solver (default is 100)
+    info : dict, optional
+        If given, it is filled with information on the solution: solver, and for 'subspace' the
+        number of iterations, the relative residuals, the tolerance and convergence (default is None)
+    slaves : np.array, optional
+        Slave dofs (0-based, global numbering) condensed onto the remaining dofs with a Guyan
+        (static) reduction before the eigen solve. The mode shapes are expanded back to all free
+        dofs. Constrained dofs in slaves are ignored (default is None)
+    df : np.array, optional
+        Sorted index of the free dofs from freedofs. If None, it is computed from bound (default is None)
+    factor : dict, optional
+        Storage for the sparse LU factorization of the shifted stiffness matrix used by the 'sparse'
+        and 'subspace' solvers. The factorization is kept in the dict and reused in later calls
+        as long as K (and target) is unchanged, e.g. in studies where only the mass changes. If M
+        changed since the factorization, the shifted systems are solved iteratively with the stored
+        factorization as preconditioner, or factorized again if a target is given or the iterative
+        solution does not converge (default is None, factorized in every call)
 
     Returns
     -------
@@ -25,29 +66,204 @@ def NFA(K, M, nno, ldof, bound, solve_subset=None):
         Natural frequencies
     U : np.array
         Mode shapes
-    """  
+    """
+
+    # Index of the free dofs, sorted
+    if df is None:
+        df = freedofs(bound, nno, ldof)
+
+    # Eliminate the constrained dofs, a single fancy index (one copy) for dense and sparse matrices
+    # K and M are only overwritten by the dense eigensolver if they are copies (owned)
+    owned = df.size < K.shape[0]
+    if owned:
+        K = K[np.ix_(df, df)]
+        M = M[df] if M.ndim == 1 else M[np.ix_(df, df)]
+
+    # Guyan (static) condensation of the slave dofs
+    T = None
+    if slaves is not None and len(slaves) > 0:
+        s = np.flatnonzero(np.isin(df, slaves))
+        K, M, T = guyan(K, M, s)
+        owned = True
+        if U0 is not None:
+            U0 = U0[np.setdiff1d(np.arange(T.shape[0]), s)]
+
+    # Choose the eigensolver
+    if solver == 'auto':
+        solver = 'sparse' if (solve_subset is not None and K.shape[0] > threshold) else 'dense'
+    if solver in ('sparse', 'subspace') and (solve_subset is None or 2*(solve_subset[1] + 1) >= K.shape[0]):
+        solver = 'dense'
+    if info is not None:
+        info['solver'] = solver
 
-    if np.any(bound):
-        # Initialize index for constrained (du) and unconstrained (df) dofs
-        dof = list(range(0, ldof * nno))        # Index of total degrees of freedom
+    if solver == 'sparse':
+        D, U = _eigsh(K, M, solve_subset, target, factor)
 
-        du = [int((bound[i,0] - 1)*ldof + bound[i,1] - 1) for i in range(bound.shape[0])]
-        df = list(set(dof) - set(du))           # Index for unknown displacements
-        
-        # Solve the generalised eigenvalue problem
-        D, U = linalg.eigh(K[np.ix_(df,df)],M[np.ix_(df,df)], subset_by_index = solve_subset)
+    elif solver == 'subspace':
+        D, U = _subspace(K, M, solve_subset, U0, tol, maxiter, info, factor)
 
     else:
-        # Solve the generalised eigenvalue problem
-        D, U = linalg.eigh(K,M, subset_by_index = solve_subset)
-        
+        # The dense eigensolver requires dense matrices
+        own_k, own_m = owned or issparse(K), owned or issparse(M)
+        if issparse(K):
+            K = K.toarray()
+        if issparse(M):
+            M = M.toarray()
+
+        if M.ndim == 1:
+            # Lumped mass: transform to standard form, no Cholesky factorization of M is needed
+            s = 1/np.sqrt(M)
+            D, U = linalg.eigh(s[:,None] * K * s[None,:], subset_by_index = solve_subset, overwrite_a = True)
+            U = s[:,None] * U
+
+        else:
+            # Solve the generalised eigenvalue problem
+            D, U = linalg.eigh(K,M, subset_by_index = solve_subset, overwrite_a = own_k, overwrite_b = own_m)
+
+    # Expand the mode shapes to all free dofs
+    if T is not None:
+        U = T @ U
+
     # Calculate natural frequencies som eigenvalues
     omega = np.sqrt(D).real
 
-    # Normalize mode shape for max displacement of +1
-    for i in range(U.shape[1]):             # Loop through each mode
-        max_disp = np.max(np.abs(U[:, i]))  # Find max absolute displacement
-        if max_disp != 0:                   # Avoid division by zero
-            U[:, i] /= max_disp             # Normalize mode shape
-    
-    return omega, U
\ No newline at end of file
+    # Normalize mode shapes for max displacement of +1 (all modes at once, zero modes left as is)
+    max_disp = np.max(np.abs(U), axis=0)
+    U /= np.where(max_disp != 0, max_disp, 1.0)
+
+    return omega, U
+
+def _eigsh(K, M, solve_subset, target=None, factor=None):
+    # Sparse shift-invert Lanczos for the modes in solve_subset. K - sigma*M is factorized
+    # once with a sparse LU. Without a target, sigma is a small negative shift, so the lowest
+    # modes (including rigid body modes with zero eigenvalue) are found.
+    K = csr_matrix(K)
+    M = diags(M, format='csr') if M.ndim == 1 else csr_matrix(M)
+
+    if target is None:
+        nev = solve_subset[1] + 1
+    else:
+        nev = solve_subset[1] - solve_subset[0] + 1
+
+    if factor is None:
+        sigma = _shift(K, M) if target is None else target**2
+        D, U = eigsh(K, k=nev, M=M, sigma=sigma, which='LM')
+    else:
+        sigma, solve = _factor(K, M, target, factor)
+        OPinv = LinearOperator(K.shape, matvec=solve, dtype=float)
+        D, U = eigsh(K, k=nev, M=M, sigma=sigma, which='LM', OPinv=OPinv)
+
+    # Sort the eigenpairs in ascending order
+    order = np.argsort(D)
+    D, U = D[order], U[:, order]
+
+    if target is None:
+        D, U = D[solve_subset[0]:], U[:, solve_subset[0]:]
+
+    return D, U
+
+
+def _subspace(K, M, solve_subset, U0=None, tol=1e-6, maxiter=100, info=None, factor=None):
+    # Subspace iteration (Bathe) for the lowest modes, started from U0 (e.g. the modes of the
+    # previous step in a parameter sweep). K - sigma*M is factorized once with a sparse LU and
+    # each iteration is a block inverse iteration followed by a Rayleigh-Ritz projection.
+    K = csr_matrix(K)
+    M = diags(M, format='csr') if M.ndim == 1 else csr_matrix(M)
+    n = K.shape[0]
+    nev = solve_subset[1] + 1
+    q = min(max(2*nev, nev + 8), n)         # Block size with guard vectors
+
+    sigma, solve = _factor(K, M, None, {} if factor is None else factor)
+
+    # Starting block from the previous modes, completed with random vectors
+    X = np.random.default_rng(0).standard_normal((n, q))
+    if U0 is not None and U0.shape[0] == n:
+        m = min(U0.shape[1], q)
+        X[:, :m] = U0[:, :m]
+
+    for it in range(1, maxiter + 1):
+        # Block inverse iteration, orthonormalized to keep the projected problem well conditioned
+        Y = np.linalg.qr(solve(M @ X))[0]
+
+        # Rayleigh-Ritz projection
+        D, Q = linalg.eigh(Y.T @ (K @ Y), Y.T @ (M @ Y))
+        X = Y @ Q
+
+        # Relative residual of the requested modes
+        R = K @ X[:, :nev] - (M @ X[:, :nev]) * D[:nev]
+        res = np.linalg.norm(R, axis=0) / ((np.abs(D[:nev]) + abs(sigma)) * np.linalg.norm(M @ X[:, :nev], axis=0))
+        if np.all(res <= tol):
+            break
+
+    if info is not None:
+        info['iterations'] = it
+        info['residuals'] = res[solve_subset[0]:]
+        info['tol'] = tol
+        info['converged'] = bool(np.all(res <= tol))
+
+    return D[solve_subset[0]:nev], X[:, solve_subset[0]:nev]
+
+def _shift(K, M):
+    # Small negative shift relative to the ratio of the stiffness and mass diagonals
+    return -1e-6 * K.diagonal().mean() / M.diagonal().mean()
+
+def _factor(K, M, target, factor):
+    # Sparse LU factorization of K - sigma*M, stored in factor and reused while K and the target
+    # are unchanged. Without a target the shift of the stored factorization is kept, so a change
+    # of M alone does not trigger a new factorization. With a target K - sigma*M is indefinite,
+    # so it is factorized again when M changes. Returns sigma and a solver for K - sigma*M.
+    key, mkey = (_checksum(K), target), _checksum(M)
+    if factor.get('key') != key:
+        factor.clear()
+        factor.update(key=key, sigma=_shift(K, M) if target is None else target**2, count=0)
+        _refactor(K, M, mkey, factor)
+    elif factor['M'] != mkey and target is not None:
+        _refactor(K, M, mkey, factor)
+    factor['count'] += 1
+
+    sigma, lu = factor['sigma'], factor['lu']
+    if factor['M'] == mkey:
+        return sigma, lu.solve
+
+    # M changed: iterative refinement on K - sigma*M with the stored factorization (all columns
+    # at once), columns that do not converge are solved with preconditioned conjugate gradients
+    # (K - sigma*M is positive definite for the negative default shift). If these fail as well,
+    # K - sigma*M is factorized again
+    A = (K - sigma*M).tocsr()
+    P = LinearOperator(K.shape, matvec=lu.solve, dtype=float)
+
+    def solve(b):
+        if factor['M'] == mkey:
+            return factor['lu'].solve(b)
+        x = lu.solve(b)
+        bnorm = np.linalg.norm(b, axis=0)
+        rnorm = np.inf
+        for _ in range(20):
+            r = b - A @ x
+            if np.all(np.linalg.norm(r, axis=0) <= 1e-10*bnorm):
+                return x
+            if not np.all(np.linalg.norm(r, axis=0) < rnorm):
+                break                               # Diverges, M changed too much
+            rnorm = np.linalg.norm(r, axis=0)
+            x += lu.solve(r)
+        B, X = b.reshape(b.shape[0], -1), x.reshape(b.shape[0], -1)
+        for j in np.flatnonzero(~(np.linalg.norm(B - A @ X, axis=0) <= 1e-10*np.linalg.norm(B, axis=0))):
+            x0 = X[:, j] if np.linalg.norm(B[:, j] - A @ X[:, j]) < np.linalg.norm(B[:, j]) else None
+            X[:, j], status = cg(A, B[:, j], x0=x0, M=P, rtol=1e-10, atol=0.0, maxiter=200)
+            if status != 0 or not np.linalg.norm(B[:, j] - A @ X[:, j]) <= 1e-8*np.linalg.norm(B[:, j]):
+                _refactor(K, M, mkey, factor)
+                return factor['lu'].solve(b)
+        return x
+
+    return sigma, solve
+
+def _refactor(K, M, mkey, factor):
+    # Factorizes K - sigma*M with the shift stored in factor, for the mass matrix with checksum mkey
+    factor.update(lu=splu((K - factor['sigma']*M).tocsc()), M=mkey)
+
+def _checksum(A):
+    # Hash of the values and structure of a sparse matrix
+    h = hashlib.sha1(A.data.tobytes())
+    h.update(A.indices.tobytes())
+    h.update(A.indptr.tobytes())
+    return h.hexdigest()
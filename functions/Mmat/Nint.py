@@ -8,11 +8,13 @@ def Nint(s, L):
     ----------
     s : float
        Local coordinate (interpolation point)
+    L : float or np.array
+       Length of element, scalar or shape (nne,)
 
     Returns
     -------
     : np.array
-      Shape functions matrix
+      Shape functions matrix, shape (4, 12) or (nne, 4, 12)
     """
 
     # Shape functions for element in local coordinates
@@ -24,9 +26,10 @@ def Nint(s, L):
     N6 = L*(-((1 + s)/2)**2 + ((1 + s)/2)**3)
 
     # Shape functions matrix in local coordinates
-    N = np.array([[N1, 0,  0,  0,  0,  0,  N4, 0,  0,  0,  0,  0 ],
-                  [0,  N2, 0,  0,  0,  N3, 0,  N5, 0,  0,  0,  N6],
-                  [0,  0,  N2, 0, -N3, 0,  0,  0,  N5, 0, -N6, 0 ],
-                  [0,  0,  0,  N1, 0,  0,  0,  0,  0,  N4, 0,  0 ]])
+    N = np.zeros(np.shape(L) + (4, 12))
+    N[..., 0, 0], N[..., 0, 6] = N1, N4
+    N[..., 1, 1], N[..., 1, 5], N[..., 1, 7], N[..., 1, 11] = N2, N3, N5, N6
+    N[..., 2, 2], N[..., 2, 4], N[..., 2, 8], N[..., 2, 10] = N2, -N3, N5, -N6
+    N[..., 3, 3], N[..., 3, 9] = N1, N4
 
-    return N
\ No newline at end of file
+    return N
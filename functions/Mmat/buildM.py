@@ -1,7 +1,12 @@
 import numpy as np
-from functions.Mmat.mbeam import mbeam
+from scipy.sparse import csr_matrix
+from functions.Kmat.Abeam import cbeam, rotate
+from functions.Mmat.mbeam import mbeam_local
+from functions.Mmat.mlump import mlump
+from functions.Kmat.assemble import edof, mtable, assemble, assemblediag
 
-def buildM(X, C, mprop, nno, nne, ldof, TP=False):
+def buildM(X, C, mprop, nno, nne, ldof, TP=False, sparse=False, cache=None, plan=None, geom=None, mass='consistent',
+           footing=None):
     """
     Builds the system mass matrix from element mass matrices
 
@@ -21,53 +26,134 @@ def buildM(X, C, mprop, nno, nne, ldof, TP=False):
         Number of degrees of freedom per node
     TP : bool, optional
         If True, the additional mass and inertia is added to the mass matrix (default is False)
+    sparse : bool, optional
+        If True, the element contributions are collected as triplets and the system
+        matrix is returned as a scipy.sparse CSR matrix (default is False)
+    cache : VIBelemcache, optional
+        Element matrix cache. If given, local element matrices are looked up in the cache
+        and only rotated per element (default is None)
+    plan : VIBplan, optional
+        Assembly plan for the topology. If given, the precomputed scatter map and sparsity
+        pattern are used for the assembly (default is None)
+    geom : tuple, optional
+        Element geometry (c, L) from cbeam for all elements. If None, it is computed from X (default is None)
+    mass : str, optional
+        Mass formulation, 'consistent' or 'lumped' (HRZ lumping, default is 'consistent')
+    footing : np.array, optional
+        Node numbers of the footings (1-based). If None, nodes 117-120 of the default mesh are used (default is None)
 
     Returns
     -------
-    Mmat : np.array
-        System consistent mass matrix in global coordinates
+    Mmat : np.array or scipy.sparse.csr_matrix
+        System consistent mass matrix in global coordinates. For the lumped formulation the
+        diagonal of the mass matrix is returned as a vector of shape (ndof,)
     """
 
-    # Initialize M matrix
-    Mmat = np.zeros((nno*ldof,nno*ldof))
-
-    # Loop over elements
-    for i in range(nne):
-        # Define element properties
-        propno = C[i,2]
-        # Cross section area and material density
-        Ge = [mprop[propno]['A'], mprop[propno]['rho'], mprop[propno]['J']]
-
-        # Define element coordinates
-        n1 = X[C[i,0]-1]
-        n2 = X[C[i,1]-1]
-
-        # Define element mass matrix (global coordinates)
-        # NOTE: The polynomial order is hardcoded to 6
-        m = mbeam(n1, n2, Ge, 6)
-
-        # Define element degrees of freedom
-        de = np.array([6*C[i,0]-5, 6*C[i,0]-4, 6*C[i,0]-3, 6*C[i,0]-2, 6*C[i,0]-1, 6*C[i,0],
-                       6*C[i,1]-5, 6*C[i,1]-4, 6*C[i,1]-3, 6*C[i,1]-2, 6*C[i,1]-1, 6*C[i,1]])
-        
-        # Add element stiffness matrix to system stiffness matrix
-        Mmat[np.ix_(de - 1, de - 1)] += m
-    
-    # Additional mass to footings
-    Mmat[6*116, 6*116] += 0.787
-    Mmat[6*116+1, 6*116+1] += 0.787
-    Mmat[6*116+2, 6*116+2] += 0.787
-
-    Mmat[6*117, 6*117] += 0.787
-    Mmat[6*117+1, 6*117+1] += 0.787
-    Mmat[6*117+2, 6*117+2] += 0.787
-
-    Mmat[6*118, 6*118] += 0.787
-    Mmat[6*118+1, 6*118+1] += 0.787
-    Mmat[6*118+2, 6*118+2] += 0.787
-
-    Mmat[6*119, 6*119] += 0.787
-    Mmat[6*119+1, 6*119+1] += 0.787
-    Mmat[6*119+2, 6*119+2] += 0.787
+    # Element geometry (direction cosines and length) for all elements
+    if geom is None:
+        geom = cbeam(X[C[:,0]-1], X[C[:,1]-1])
+    c, L = geom
+
+    # Element properties for all elements
+    # Cross section area and material density
+    Ge = mtable(mprop, C[:,2], ['A', 'rho', 'J'])
+
+    # Local element mass matrices for all elements at once, shape (nne, 12, 12)
+    # NOTE: The polynomial order is hardcoded to 6
+    if cache is None:
+        m_l = mbeam_local(L, Ge, 6)
+    else:
+        m_l = cache.mbeam(L, C[:,2], Ge, 6)
+
+    # Lumped mass matrix, assembled as a vector
+    if mass == 'lumped':
+        Mmat = assemblediag(mlump(m_l, c), edof(C, ldof), nno*ldof)
+        return addfooting(Mmat, sparse, plan, footing)
+
+    # Transform to global coordinates
+    m = rotate(c, m_l)
+
+    # Add element mass matrices to system mass matrix
+    if plan is None:
+        Mmat = assemble(m, edof(C, ldof), nno*ldof, sparse)
+    else:
+        Mmat = plan.assemble(m, sparse)
+
+    return addfooting(Mmat, sparse, plan, footing)
+
+def addfooting(Mmat, sparse=False, plan=None, footing=None):
+    """
+    Adds the additional mass of the footings to the system mass matrix
+
+    Parameters
+    ----------
+    Mmat : np.array or scipy.sparse.csr_matrix
+        System mass matrix (or its diagonal as a vector for the lumped formulation)
+    sparse : bool, optional
+        If True, Mmat is a scipy.sparse CSR matrix (default is False)
+    plan : VIBplan, optional
+        Assembly plan used to assemble Mmat (default is None)
+    footing : np.array, optional
+        Node numbers of the footings (1-based). If None, nodes 117-120 of the default mesh are used (default is None)
+
+    Returns
+    -------
+    Mmat : np.array or scipy.sparse.csr_matrix
+        System mass matrix including footing masses
+    """
+
+    # Additional mass to footings (translational dofs of the footing nodes, default node 117-120)
+    if footing is None:
+        footing = np.arange(117, 121)
+    footing = ((np.asarray(footing, dtype=int)[:, None] - 1)*6 + np.arange(3)).ravel()
+
+    if Mmat.ndim == 1:
+        Mmat[footing] += 0.787
+    elif plan is not None:
+        Mmat = plan.adddiag(Mmat, footing, 0.787)
+    elif sparse:
+        Mmat += csr_matrix((np.full(footing.size, 0.787), (footing, footing)), shape=Mmat.shape)
+    else:
+        Mmat[footing, footing] += 0.787
     
-    return Mmat
\ No newline at end of file
+    return Mmat
+
+def addmass(Mmat, point_mass, ldof, sparse=False, plan=None):
+    """
+    Adds point masses and inertias (e.g. RNA or top masses) to the system mass matrix
+
+    Parameters
+    ----------
+    Mmat : np.array or scipy.sparse.csr_matrix
+        System mass matrix (or its diagonal as a vector for the lumped formulation)
+    point_mass : np.array
+        Point mass matrix = [nodeno, dof, mass]. Negative values remove a mass added before
+    ldof : int
+        Number of degrees of freedom per node
+    sparse : bool, optional
+        If True, Mmat is a scipy.sparse CSR matrix (default is False)
+    plan : VIBplan, optional
+        Assembly plan used to assemble Mmat (default is None)
+
+    Returns
+    -------
+    Mmat : np.array or scipy.sparse.csr_matrix
+        System mass matrix including point masses
+    """
+
+    if not np.any(point_mass):
+        return Mmat
+
+    point_mass = np.asarray(point_mass, dtype=float)
+    dof = ((point_mass[:,0] - 1)*ldof + point_mass[:,1] - 1).astype(int)
+
+    if Mmat.ndim == 1:
+        np.add.at(Mmat, dof, point_mass[:,2])
+    elif plan is not None:
+        Mmat = plan.adddiag(Mmat, dof, point_mass[:,2])
+    elif sparse:
+        Mmat += csr_matrix((point_mass[:,2], (dof, dof)), shape=Mmat.shape)
+    else:
+        np.add.at(Mmat, (dof, dof), point_mass[:,2])
+
+    return Mmat
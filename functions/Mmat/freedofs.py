@@ -0,0 +1,27 @@
+import numpy as np
+
+def freedofs(bound, nno, ldof):
+    """
+    Index of the unconstrained (free) degrees of freedom
+
+    Parameters
+    ----------
+    bound : np.array
+        Nodal boundary conditions = [node number, dof, disp]
+    nno : int
+        Total number of nodes
+    ldof : int
+        Number of degrees of freedom per node
+
+    Returns
+    -------
+    df : np.array
+        Sorted index of the free dofs (0-based)
+    """
+
+    if not np.any(bound):
+        return np.arange(nno*ldof)
+
+    bound = np.asarray(bound)
+    du = ((bound[:,0] - 1)*ldof + bound[:,1] - 1).astype(int)     # Index of constrained dofs
+    return np.setdiff1d(np.arange(nno*ldof), du)
@@ -0,0 +1,118 @@
+import numpy as np
+from scipy import linalg
+from scipy.sparse import issparse, csc_matrix
+from scipy.sparse.linalg import splu
+
+def guyan(K, M, slaves):
+    """
+    Guyan (static) condensation of the slave dofs onto the remaining (master) dofs. The slave
+    dofs follow the masters statically, u_s = -Kss^-1 Ksm u_m, which gives the transformation
+    u = T u_m and the reduced matrices Kr = T^T K T and Mr = T^T M T.
+
+    Parameters
+    ----------
+    K : np.array or scipy.sparse matrix
+        Stiffness matrix
+    M : np.array or scipy.sparse matrix
+        Mass matrix, or its diagonal as a vector of shape (ndof,) for a lumped mass matrix
+    slaves : np.array
+        Index of the slave dofs (0-based, rows of K)
+
+    Returns
+    -------
+    Kr : np.array
+        Reduced stiffness matrix
+    Mr : np.array
+        Reduced mass matrix
+    T : np.array
+        Transformation matrix from the master dofs to all dofs, shape (ndof, nmasters)
+    """
+
+    n = K.shape[0]
+    s = np.unique(np.asarray(slaves, dtype=int))
+    m = np.setdiff1d(np.arange(n), s)
+
+    # Static modes of the slave dofs, Ts = -Kss^-1 Ksm
+    if issparse(K):
+        K = csc_matrix(K)
+        Ksm = K[s][:, m].toarray()
+        Ts = -splu(K[s][:, s].tocsc()).solve(Ksm)
+        Kr = K[m][:, m].toarray() + Ksm.T @ Ts
+    else:
+        Ksm = K[np.ix_(s, m)]
+        Ts = -linalg.solve(K[np.ix_(s, s)], Ksm, assume_a='sym')
+        Kr = K[np.ix_(m, m)] + Ksm.T @ Ts
+
+    # Reduced mass matrix, Mr = Mmm + Mms Ts + Ts^T Msm + Ts^T Mss Ts
+    if M.ndim == 1:
+        Mr = np.diag(M[m]) + Ts.T @ (M[s][:, None] * Ts)
+    else:
+        if issparse(M):
+            M = csc_matrix(M)
+            Mmm, Msm, Mss = M[m][:, m].toarray(), M[s][:, m].toarray(), M[s][:, s]
+        else:
+            Mmm, Msm, Mss = M[np.ix_(m, m)], M[np.ix_(s, m)], M[np.ix_(s, s)]
+        MsmTs = Msm.T @ Ts
+        Mr = Mmm + MsmTs + MsmTs.T + Ts.T @ (Mss @ Ts)
+
+    # Transformation matrix, identity on the masters and static modes on the slaves
+    T = np.zeros((n, m.size))
+    T[m, np.arange(m.size)] = 1.0
+    T[s] = Ts
+
+    # Symmetrize against round-off
+    return (Kr + Kr.T)/2, (Mr + Mr.T)/2, T
+
+def slavedofs(X, C, ldof, reduce='internal', tol=1e-8):
+    """
+    Automatic selection of slave dofs for the Guyan condensation
+
+    Parameters
+    ----------
+    X : np.array
+        Nodal coordinates
+    C : np.array
+        Connectivity matrix
+    ldof : int
+        Number of degrees of freedom per node
+    reduce : str or list, optional
+        'internal' for all dofs of internal member nodes (nodes of subdivided members, with exactly
+        two collinear elements of the same material property number), 'rotations' for the
+        rotational dofs of all nodes, or a list of both (default is 'internal')
+    tol : float, optional
+        Tolerance on the cross product of the element directions for collinearity (default is 1e-8)
+
+    Returns
+    -------
+    slaves : np.array
+        Slave dofs (0-based)
+    """
+
+    reduce = [reduce] if isinstance(reduce, str) else list(reduce)
+    nno = X.shape[0]
+    slaves = []
+
+    if 'internal' in reduce:
+        # Elements connected to each node, sorted by node
+        nodes = C[:, 0:2].ravel() - 1
+        elem = np.repeat(np.arange(C.shape[0]), 2)
+        order = np.argsort(nodes, kind='stable')
+        nodes, elem = nodes[order], elem[order]
+        count = np.bincount(nodes, minlength=nno)
+
+        # Nodes with exactly two elements, e1 and e2
+        first = np.searchsorted(nodes, np.flatnonzero(count == 2))
+        e1, e2 = elem[first], elem[first + 1]
+
+        # Element directions
+        d = X[C[:,1]-1] - X[C[:,0]-1]
+        d /= np.linalg.norm(d, axis=1)[:, None]
+        collinear = np.linalg.norm(np.cross(d[e1], d[e2]), axis=1) < tol
+
+        internal = nodes[first][collinear & (C[e1, 2] == C[e2, 2])]
+        slaves.append((internal[:, None]*ldof + np.arange(ldof)).ravel())
+
+    if 'rotations' in reduce:
+        slaves.append((np.arange(nno)[:, None]*ldof + np.arange(3, ldof)).ravel())
+
+    return np.unique(np.concatenate(slaves)) if slaves else np.zeros(0, dtype=int)
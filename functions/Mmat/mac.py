@@ -0,0 +1,86 @@
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+def mac(U1, U2, M=None):
+    """
+    Modal Assurance Criterion between two sets of mode shapes, all pairs at once.
+    MAC[i,j] = |U1[:,i]^T W U2[:,j]|^2 / ((U1[:,i]^T W U1[:,i]) (U2[:,j]^T W U2[:,j])),
+    with W = I or the mass matrix (mass-weighted MAC)
+
+    Parameters
+    ----------
+    U1 : np.array
+        Mode shapes, shape (ndof, number of modes), e.g. U of a VIBframe (free dofs)
+    U2 : np.array
+        Mode shapes on the same dofs, shape (ndof, number of modes)
+    M : np.array or scipy.sparse matrix, optional
+        Mass matrix on the same dofs, or its diagonal as a vector (default is None, unweighted)
+
+    Returns
+    -------
+    MAC : np.array
+        MAC matrix, shape (number of modes in U1, number of modes in U2), values between 0 and 1
+    """
+
+    if U1.shape[0] != U2.shape[0]:
+        raise ValueError('Mode shapes must be given on the same dofs')
+
+    # Weighted mode shapes, W U
+    if M is None:
+        WU1, WU2 = U1, U2
+    elif np.ndim(M) == 1:
+        WU1, WU2 = M[:,None] * U1, M[:,None] * U2
+    else:
+        WU1, WU2 = M @ U1, M @ U2
+
+    cross = np.abs(U1.conj().T @ WU2)**2
+    n1 = np.einsum('ij,ij->j', U1.conj(), WU1).real
+    n2 = np.einsum('ij,ij->j', U2.conj(), WU2).real
+    den = np.outer(n1, n2)
+
+    return np.divide(cross, den, out=np.zeros_like(cross), where=den > 0)
+
+def pairmodes(omega1, U1, omega2, U2, M=None, threshold=0.0):
+    """
+    Pairs the modes of two results (e.g. design variants, mesh refinements or measured and
+    model modes) by solving the assignment problem that maximizes the total MAC, so modes are
+    matched by shape and not by order when close modes cross. Repeated modes (e.g. the bending
+    mode pairs of the symmetric jacket) are only defined up to a rotation within their pair, so
+    they can be paired with a MAC below 1
+
+    Parameters
+    ----------
+    omega1 : np.array
+        Natural frequencies of the first set (the reference)
+    U1 : np.array
+        Mode shapes of the first set, shape (ndof, len(omega1))
+    omega2 : np.array
+        Natural frequencies of the second set
+    U2 : np.array
+        Mode shapes of the second set on the same dofs, shape (ndof, len(omega2))
+    M : np.array or scipy.sparse matrix, optional
+        Mass matrix for the mass-weighted MAC (default is None, unweighted)
+    threshold : float, optional
+        Pairs with a MAC below threshold are discarded (default is 0.0)
+
+    Returns
+    -------
+    pairs : np.array
+        Mode indices of the pairs, [index in set 1, index in set 2], sorted by the first set
+    omega : np.array
+        Paired natural frequencies, [omega1, omega2]
+    values : np.array
+        MAC value of each pair
+    """
+
+    MAC = mac(U1, U2, M)
+
+    # Optimal assignment (rectangular if the number of modes differ)
+    i1, i2 = linear_sum_assignment(MAC, maximize=True)
+    keep = MAC[i1, i2] >= threshold
+    i1, i2 = i1[keep], i2[keep]
+
+    pairs = np.column_stack((i1, i2))
+    omega = np.column_stack((np.asarray(omega1)[i1], np.asarray(omega2)[i2]))
+
+    return pairs, omega, MAC[i1, i2]
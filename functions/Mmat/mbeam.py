@@ -1,21 +1,22 @@
 import numpy as np
-from functions.Kmat.Abeam import Abeam
+from functions.Kmat.Abeam import cbeam, rotate
 from functions.Kmat.intpL import intpL
-from functions.Mmat.Nint import Nint
+from functions.Kmat.quadrature import Ntable
 
 
 def mbeam(n1, n2, Ge, PolDeg):
     """
-    Creates the element mass matrix for a beam element in global coordinates
+    Creates the element mass matrix for a beam element in global coordinates. All inputs may be
+    stacked along a leading element axis, in which case the mass matrices of all elements are built at once.
 
     Parameters
     ----------
     n1 : np.array
-        Coordinates of node 1
+        Coordinates of node 1, shape (3,) or (nne, 3)
     n2 : np.array
-        Coordinates of node 2
+        Coordinates of node 2, shape (3,) or (nne, 3)
     Ge : list
-        Element properties 
+        Element properties (floats or arrays of shape (nne,))
         list = [A, rho, J]
     PolDeg : int
         Polynomial degree of the integration rule
@@ -23,25 +24,49 @@ def mbeam(n1, n2, Ge, PolDeg):
     Returns
     -------
     m : np.array
-        Element mass matrix in global coordinates
+        Element mass matrix in global coordinates, shape (12, 12) or (nne, 12, 12)
+    """
+
+    c, L = cbeam(n1,n2)
+    m_l = mbeam_local(L, Ge, PolDeg)
+
+    # The mass matrix is transformed to global coordinates
+    m = rotate(c, m_l)
+
+    return m
+
+
+def mbeam_local(L, Ge, PolDeg):
+    """
+    Creates the element mass matrix for a beam element in local coordinates. Inputs may be
+    stacked along a leading element axis.
+
+    Parameters
+    ----------
+    L : float or np.array
+        Length of element, scalar or shape (nne,)
+    Ge : list
+        Element properties (floats or arrays of shape (nne,))
+        list = [A, rho, J]
+    PolDeg : int
+        Polynomial degree of the integration rule
+
+    Returns
+    -------
+    m_l : np.array
+        Element mass matrix in local coordinates, shape (12, 12) or (nne, 12, 12)
     """
 
-    A, L = Abeam(n1,n2)
     xip, wip = intpL(PolDeg)
     J = L/2
 
-    m_l = np.zeros((12,12))
+    # Material matrix (diagonal entries)
+    D = np.stack(np.broadcast_arrays(Ge[0]*Ge[1], Ge[0]*Ge[1], Ge[0]*Ge[1], Ge[1]*Ge[2]), axis=-1)
 
-    D = np.array([[Ge[0]*Ge[1], 0, 0, 0],
-                  [0, Ge[0]*Ge[1], 0, 0],
-                  [0, 0, Ge[0]*Ge[1], 0],
-                  [0, 0, 0, Ge[1]*Ge[2]]])
+    # Shape functions at all Gauss points, scaled from the precomputed tables, shape (..., nip, 4, 12)
+    N0, N1 = Ntable(len(xip))
+    N = N0 + np.asarray(L)[..., None, None, None] * N1
 
-    for i in range(len(xip)):
-        N = Nint(xip[i], L)
-        m_l += N.T @ D @ N * wip[i] * J
-
-    # The mass matrix is transformed to global coordinates
-    m = A.T @ m_l @ A
+    m_l = np.einsum('...pri,...r,...prj,p->...ij', N, D, N, wip, optimize=True) * np.asarray(J)[..., None, None]
 
-    return m
\ No newline at end of file
+    return m_l
@@ -0,0 +1,41 @@
+import numpy as np
+
+def mlump(m_l, c):
+    """
+    Lumped (diagonal) element mass matrices by HRZ lumping of the consistent local mass matrix.
+    The diagonal terms of each direction are scaled so they sum to the total mass (or torsional
+    inertia) of the element, and the rotational terms are scaled with the factor of the
+    translation they are coupled to. The translational masses are equal in all directions and
+    stay diagonal in global coordinates; for the rotational inertia the diagonal of the
+    transformed 3x3 block is kept.
+
+    Parameters
+    ----------
+    m_l : np.array
+        Consistent element mass matrices in local coordinates, shape (nne, 12, 12)
+    c : np.array
+        Direction cosine matrices for the elements, shape (nne, 3, 3)
+
+    Returns
+    -------
+    m : np.array
+        Diagonal of the lumped element mass matrices in global coordinates, shape (nne, 12)
+    """
+
+    d = np.diagonal(m_l, axis1=-2, axis2=-1).copy()
+
+    # Groups of dofs (node 1, node 2) lumped together and the dofs scaled with the same factor
+    # [axial, y-translation (+ rot. z), z-translation (+ rot. y), torsion]
+    groups = [([0, 6], []), ([1, 7], [5, 11]), ([2, 8], [4, 10]), ([3, 9], [])]
+
+    for (i, j), rot in groups:
+        # Total mass of the group is the sum of the consistent block
+        total = m_l[..., i, i] + m_l[..., i, j] + m_l[..., j, i] + m_l[..., j, j]
+        alpha = total / (d[..., i] + d[..., j])
+        d[..., [i, j] + rot] *= alpha[..., None]
+
+    # Transform each 3x3 diagonal block to global coordinates and keep the diagonal
+    d = d.reshape(d.shape[:-1] + (4, 3))
+    m = np.einsum('...ji,...bj->...bi', c**2, d)
+
+    return m.reshape(m.shape[:-2] + (12,))
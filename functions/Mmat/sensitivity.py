@@ -0,0 +1,117 @@
+import numpy as np
+from functions.Kmat.Abeam import cbeam
+from functions.Kmat.kbeam import kbeam_local
+from functions.Kmat.assemble import edof, mtable
+from functions.Mmat.mbeam import mbeam_local
+from functions.Mmat.mlump import mlump
+from functions.Mmat.freedofs import freedofs
+
+def sensitivity(Model, params=('E', 'A', 'Iz', 'Iy', 'G', 'J', 'rho'), springs=True):
+    """
+    Analytic sensitivities of the natural frequencies with respect to the material properties of
+    each property number and the spring stiffnesses, from the solved modes of the model. For a
+    parameter p, dlambda/dp = phi^T (dK/dp - lambda dM/dp) phi / (phi^T M phi) with lambda = omega**2,
+    and domega/dp = dlambda/dp / (2 omega). The element derivative matrices follow from the
+    kbeam/mbeam formulation, which is linear in the diagonal of the material matrix.
+
+    Parameters
+    ----------
+    Model : VIBframe
+        Solved model (K, M, omega, U and the input X, C, mprop, spring_support)
+    params : tuple, optional
+        Material properties to differentiate with respect to, per property number
+        (default is ('E', 'A', 'Iz', 'Iy', 'G', 'J', 'rho'))
+    springs : bool, optional
+        If True, the sensitivities with respect to each spring in spring_support are added (default is True)
+
+    Returns
+    -------
+    domega : np.array
+        Sensitivity matrix, shape (number of modes, number of parameters). Rigid body modes
+        (omega = 0) have zero sensitivity
+    labels : list
+        Parameter of each column, (propno, property) or ('spring', row in spring_support)
+    """
+
+    X, C, mprop, ldof, nno = Model.X, Model.C, Model.mprop, Model.ldof, Model.nno
+    M, U = Model.M, Model.U
+    omega = np.nan_to_num(Model.omega)
+    lam = omega**2
+
+    # Mode shapes on all dofs
+    df = getattr(Model, 'df', None)
+    if df is None:
+        df = freedofs(Model.bound, nno, ldof)
+    Uf = np.zeros((nno*ldof, U.shape[1]))
+    Uf[df] = U
+
+    # Modal masses, phi^T M phi
+    if np.ndim(M) == 1:
+        mm = np.einsum('i,ij->j', M, Uf**2)
+    else:
+        mm = np.einsum('ij,ij->j', Uf, M @ Uf)
+
+    # Element geometry and modal displacements in local coordinates, shape (nne, 12, nmodes)
+    geom = getattr(Model, 'geom', None)
+    c, L = cbeam(X[C[:,0]-1], X[C[:,1]-1]) if geom is None else geom
+    phi = Uf[edof(C, ldof)].reshape(-1, 4, 3, U.shape[1])
+    ul = np.einsum('eji,ebim->ebjm', c, phi).reshape(-1, 12, U.shape[1])
+
+    # Element strain energy per component of the material matrix, [EA, EIz, EIy, GJ], for unit values
+    q = []
+    for r in range(4):
+        unit = np.zeros(6)
+        unit[[0, 0, 0, 4][r]] = 1.0
+        unit[[1, 2, 3, 5][r]] = 1.0
+        k_r = kbeam_local(L, list(unit), 3)
+        q.append(np.einsum('eim,eij,ejm->em', ul, k_r, ul))
+
+    # Element kinetic energy for unit A*rho (translations and bending) and unit rho*J (torsion)
+    m_a = mbeam_local(L, [1.0, 1.0, 0.0], 6)
+    m_j = mbeam_local(L, [0.0, 1.0, 1.0], 6)
+    if getattr(Model, 'mass', 'consistent') == 'lumped':
+        # HRZ lumping scales each group independently, so the lumped matrix is linear in A*rho and rho*J
+        torsion = np.isin(np.arange(12), [3, 9])
+        d = mlump(m_a + m_j, np.broadcast_to(np.eye(3), c.shape))
+        t_a = _lumped(np.where(torsion, 0.0, d), c, phi)
+        t_j = _lumped(np.where(torsion, d, 0.0), c, phi)
+    else:
+        t_a = np.einsum('eim,eij,ejm->em', ul, m_a, ul)
+        t_j = np.einsum('eim,eij,ejm->em', ul, m_j, ul)
+
+    # Element properties
+    E, A, Iz, Iy, G, J, rho = mtable(mprop, C[:,2], ['E', 'A', 'Iz', 'Iy', 'G', 'J', 'rho'])
+    dlam_e = {
+        'E': A[:,None]*q[0] + Iz[:,None]*q[1] + Iy[:,None]*q[2],
+        'A': E[:,None]*q[0] - lam*rho[:,None]*t_a,
+        'Iz': E[:,None]*q[1],
+        'Iy': E[:,None]*q[2],
+        'G': J[:,None]*q[3],
+        'J': G[:,None]*q[3] - lam*rho[:,None]*t_j,
+        'rho': -lam*(A[:,None]*t_a + J[:,None]*t_j),
+    }
+
+    # Sum the element contributions per property number, columns ordered by propno and then params
+    props = np.unique(C[:,2])
+    S = (C[:,2][:, None] == props[None, :]).astype(float)
+    dlam = np.einsum('ep,kem->mpk', S, np.stack([dlam_e[k] for k in params])).reshape(U.shape[1], -1)
+    labels = [(int(p), k) for p in props for k in params]
+
+    # Spring supports, dK/dk = e e^T for the dof of the spring
+    if springs and np.any(Model.spring_support):
+        s = np.asarray(Model.spring_support)
+        dof = ((s[:,0] - 1)*ldof + s[:,1] - 1).astype(int)
+        dlam = np.hstack((dlam, Uf[dof].T**2))
+        labels += [('spring', i) for i in range(s.shape[0])]
+
+    dlam /= mm[:, None]
+
+    # Frequency sensitivities, zero for rigid body modes
+    domega = np.divide(dlam, 2*omega[:, None], out=np.zeros_like(dlam), where=omega[:, None] > 0)
+
+    return domega, labels
+
+def _lumped(d, c, phi):
+    # Kinetic energy of the lumped mass with local diagonal d, transformed as in mlump
+    m = np.einsum('eji,ebj->ebi', c**2, d.reshape(-1, 4, 3))
+    return np.einsum('ebi,ebim->em', m, phi**2)
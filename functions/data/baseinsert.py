@@ -1,35 +1,81 @@
-def baseinsert(X, C, mprop, bound, spring_support, var, Mmat, Kmat, omega, U, cur):
+import numpy as np
+from itertools import repeat
+from scipy.sparse import issparse, csr_matrix, triu
 
-    cur.execute("INSERT INTO var (id, ldof, nno, nne, ndof) VALUES (?, ?, ?, ?, ?)", 
-                (int(var[0]), int(var[1]), int(var[2]), int(var[3]), int(var[4])))
+def baseinsert(X, C, mprop, bound, spring_support, var, Mmat, Kmat, omega, U, cur, storage='rows'):
 
-    cur.executemany("INSERT INTO node (id, x, y, z) VALUES (?, ?, ?, ?)", 
-                    [(int(i), float(x), float(y), float(z)) for i, (x, y, z) in enumerate(X, start=1)])
+    # All rows are keyed by the run, var[0]
+    run_id = int(var[0])
 
-    cur.executemany("INSERT INTO connectivity (id, node1, node2, propno) VALUES (?, ?, ?, ?)", 
-                    [(int(i), int(n1), int(n2), int(p)) for i, (n1, n2, p) in enumerate(C, start=1)])
+    cur.execute("INSERT INTO var (id, ldof, nno, nne, ndof) VALUES (?, ?, ?, ?, ?)",
+                (run_id, int(var[1]), int(var[2]), int(var[3]), int(var[4])))
 
-    cur.executemany("INSERT INTO material (propno, E, A, rho, Iy, Iz, J, G, type) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", 
-                    [(int(propno), mat['E'], mat['A'], mat['rho'], mat['Iy'], mat['Iz'], mat['J'], mat['G'], mat['type']) 
+    cur.executemany("INSERT INTO node (run_id, id, x, y, z) VALUES (?, ?, ?, ?, ?)",
+                    [(run_id, int(i), float(x), float(y), float(z)) for i, (x, y, z) in enumerate(X, start=1)])
+
+    cur.executemany("INSERT INTO connectivity (run_id, id, node1, node2, propno) VALUES (?, ?, ?, ?, ?)",
+                    [(run_id, int(i), int(n1), int(n2), int(p)) for i, (n1, n2, p) in enumerate(C, start=1)])
+
+    cur.executemany("INSERT INTO material (run_id, propno, E, A, rho, Iy, Iz, J, G, type) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(run_id, int(propno), mat['E'], mat['A'], mat['rho'], mat['Iy'], mat['Iz'], mat['J'], mat['G'], mat['type'])
                      for propno, mat in mprop.items()])
 
-    cur.executemany("INSERT INTO bound (node, ldof, disp) VALUES (?, ?, ?)", 
-                    [(int(node), int(ldof), float(disp)) for node, ldof, disp in bound])
+    cur.executemany("INSERT INTO bound (run_id, node, ldof, disp) VALUES (?, ?, ?, ?)",
+                    [(run_id, int(node), int(ldof), float(disp)) for node, ldof, disp in bound])
+
+    cur.executemany("INSERT INTO spring (run_id, node, ldof, Kk) VALUES (?, ?, ?, ?)",
+                    [(run_id, int(node), int(ldof), float(Kk)) for node, ldof, Kk in spring_support])
+
+    cur.executemany("INSERT INTO Eigenvalues (run_id, id, omega) VALUES (?, ?, ?)",
+                    [(run_id, int(i), float(o)) for i, o in enumerate(omega, start=1)])
+
+    nrows = 1 + len(X) + len(C) + len(mprop) + len(bound) + len(spring_support) + len(omega)
+
+    if storage == 'blob':
+        # One row per matrix with the CSR arrays as BLOBs, and one row per mode shape
+        cur.executemany("INSERT INTO Matrices (run_id, name, format, nrows, ncols, indptr, indices, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        [(run_id, 'Mass') + _csr(Mmat), (run_id, 'Stiffness') + _csr(Kmat)])
+        cur.executemany("INSERT INTO Modes (run_id, j, U) VALUES (?, ?, ?)",
+                        [(run_id, int(j), u.tobytes()) for j, u in enumerate(np.ascontiguousarray(U.T, dtype=float), start=1)])
+        return nrows + 2 + U.shape[1]
+
+    # Nonzero entries of the matrices, extracted with NumPy (1-based indices)
+    mass_data = _triplets(Mmat, run_id)
+    cur.executemany("INSERT INTO Mass (run_id, i, j, m) VALUES (?, ?, ?, ?)", mass_data)
 
-    cur.executemany("INSERT INTO spring (node, ldof, Kk) VALUES (?, ?, ?)", 
-                    [(int(node), int(ldof), float(Kk)) for node, ldof, Kk in spring_support])
+    stiff_data = _triplets(Kmat, run_id)
+    cur.executemany("INSERT INTO Stiffness (run_id, i, j, k) VALUES (?, ?, ?, ?)", stiff_data)
 
-    mass_data = [(int(i+1), int(j+1), float(Mmat[i, j])) 
-                 for i in range(Mmat.shape[0]) for j in range(Mmat.shape[1]) if Mmat[i, j] != 0.0]
-    cur.executemany("INSERT INTO Mass (i, j, m) VALUES (?, ?, ?)", mass_data)
+    U_data = _triplets(U, run_id)
+    cur.executemany("INSERT INTO Eigenvectors (run_id, i, j, U) VALUES (?, ?, ?, ?)", U_data)
 
-    stiff_data = [(int(i+1), int(j+1), float(Kmat[i, j])) 
-                  for i in range(Kmat.shape[0]) for j in range(Kmat.shape[1]) if Kmat[i, j] != 0.0]
-    cur.executemany("INSERT INTO Stiffness (i, j, k) VALUES (?, ?, ?)", stiff_data)
+    # Number of rows inserted
+    return nrows + len(mass_data) + len(stiff_data) + len(U_data)
 
-    cur.executemany("INSERT INTO Eigenvalues (id, omega) VALUES (?, ?)", 
-                    [(int(i), float(o)) for i, o in enumerate(omega, start=1)])
+def _triplets(A, run_id):
+    # Rows (run_id, i, j, value) of the nonzero entries of a dense or sparse matrix, or of a
+    # diagonal stored as a vector (lumped mass), with 1-based indices
+    if issparse(A):
+        A = A.tocoo()
+        i, j, v = A.row, A.col, A.data
+    elif np.ndim(A) == 1:
+        i = j = np.arange(len(A))
+        v = np.asarray(A)
+    else:
+        i, j = np.nonzero(A)
+        v = A[i, j]
+    keep = v != 0.0
+    return list(zip(repeat(run_id), (i[keep] + 1).tolist(), (j[keep] + 1).tolist(), v[keep].astype(float).tolist()))
 
-    U_data = [(int(i+1), int(j+1), float(U[i, j])) 
-              for i in range(U.shape[0]) for j in range(U.shape[1]) if U[i, j] != 0.0]
-    cur.executemany("INSERT INTO Eigenvectors (i, j, U) VALUES (?, ?, ?)", U_data)
+def _csr(A):
+    # Format, shape and CSR arrays (int64 indptr, int32 indices, float64 data) as bytes. Symmetric
+    # matrices are stored as their upper triangle ('sym'), a lumped mass vector as 'diag'
+    if np.ndim(A) == 1:
+        return ('diag', len(A), len(A), None, None, np.ascontiguousarray(A, dtype=float).tobytes())
+    A = csr_matrix(A)
+    fmt = 'sym' if abs(A - A.T).max() <= 1e-12*abs(A).max() else 'csr'
+    if fmt == 'sym':
+        A = triu(A, format='csr')
+    A.eliminate_zeros()
+    return (fmt, A.shape[0], A.shape[1], A.indptr.astype(np.int64).tobytes(),
+            A.indices.astype(np.int32).tobytes(), A.data.astype(float).tobytes())
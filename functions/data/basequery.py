@@ -0,0 +1,64 @@
+import sqlite3
+import json
+import os
+import numpy as np
+from contextlib import closing
+
+def baseruns(name='Truss_DataBase.db'):
+    """
+    Lists the runs stored in a database with basestore
+
+    Parameters
+    ----------
+    name : str, optional
+        Name of the database (default is 'Truss_DataBase.db')
+
+    Returns
+    -------
+    runs : list
+        (run_id, hash, params) of each run, params as a dictionary
+    """
+
+    with closing(sqlite3.connect(_path(name))) as con:
+        rows = con.execute("SELECT run_id, hash, params FROM runs ORDER BY run_id").fetchall()
+    return [(run_id, h, json.loads(params)) for run_id, h, params in rows]
+
+def basequery(name='Truss_DataBase.db', mode=1, **params):
+    """
+    Natural frequency of one mode across all runs with the given input parameters, in a single
+    query (e.g. the frequency of mode 1 for all runs with nn_levels=4). The parameters are
+    matched in the JSON params of the runs table
+
+    Parameters
+    ----------
+    name : str, optional
+        Name of the database (default is 'Truss_DataBase.db')
+    mode : int, optional
+        Mode number (1-based, as the id in the Eigenvalues table) (default is 1)
+    **params
+        Input parameters the runs must match, e.g. nn_levels=4
+
+    Returns
+    -------
+    run_id : np.array
+        run_id of the matching runs
+    omega : np.array
+        Natural frequency of the mode in each run
+    """
+
+    sql = "SELECT r.run_id, e.omega FROM runs r JOIN Eigenvalues e ON e.run_id = r.run_id WHERE e.id = ?"
+    values = [int(mode)]
+    for key, value in params.items():
+        sql += " AND json_extract(r.params, ?) = ?"
+        values += [f'$.{key}', value.item() if isinstance(value, np.generic) else value]
+    sql += " ORDER BY r.run_id"
+
+    with closing(sqlite3.connect(_path(name))) as con:
+        rows = con.execute(sql, values).fetchall()
+    run_id = np.array([r for r, _ in rows], dtype=int)
+    omega = np.array([w for _, w in rows], dtype=float)
+    return run_id, omega
+
+def _path(name):
+    # Databases are stored in the root of the program, as in basestore
+    return os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) + '/' + name
@@ -1,9 +1,49 @@
 import sqlite3
+import time
+import json
+import hashlib
+import numpy as np
 from functions.data.baseclear import baseclear
 from functions.data.baseinsert import baseinsert
+from functions.data.utils import jsonable
 import os
 
-def basestore(Model, name='Truss_DataBase.db'):
+def basestore(Model, name='Truss_DataBase.db', storage='rows', params=None, overwrite=False):
+    """
+    Stores the input and results of a model as a new run in an SQLite database. A database holds
+    any number of runs: the runs table has the input parameters and a content hash of each run,
+    and all other tables are keyed by run_id. All rows of a run are written in a single transaction.
+
+    Parameters
+    ----------
+    Model : VIBframe
+        Solved model
+    name : str, optional
+        Name of the database (default is 'Truss_DataBase.db')
+    storage : str, optional
+        Storage of M, K and U. 'rows' stores one row per nonzero entry (tables Mass, Stiffness
+        and Eigenvectors). 'blob' stores each matrix as one row with its CSR arrays as BLOBs, the
+        upper triangle only for symmetric matrices (table Matrices), and each mode shape as one
+        BLOB (table Modes). The BLOBs are the raw arrays, not compressed (the sparse format is the
+        compression), so they are read without copying and subsets of a mode shape are read
+        directly (default is 'rows')
+    params : dict, optional
+        Input parameters of the run stored as JSON in the runs table, e.g. {'nn_levels': 4}, for
+        cross-run queries with basequery. nno, nne, ndof and solve_subset are always added (default is None)
+    overwrite : bool, optional
+        If a run with the same content hash is already stored, it is replaced if True and kept
+        (not stored again, but marked as the last run stored) if False (default is False)
+
+    Returns
+    -------
+    stats : dict
+        run_id of the run (to read it with VIBdata(name, run=run_id)), whether it was stored or
+        was already in the database (stored), number of rows stored, time [s] and throughput [rows/s]
+    """
+
+    t0 = time.time()
+    if storage not in ('rows', 'blob'):
+        raise ValueError("storage must be 'rows' or 'blob'")
 
     X = Model.X
     C = Model.C
@@ -16,7 +56,9 @@ def basestore(Model, name='Truss_DataBase.db'):
     nne = Model.nne
     ndof = Model.ndof
 
-    var = (1, ldof, nno, nne, ndof)
+    params = {'nno': int(nno), 'nne': int(nne), 'ndof': int(ndof), 'solve_subset': Model.solve_subset,
+              **({} if params is None else params)}
+    key = _hash(Model, params)
 
     Kmat = Model.K
     Mmat = Model.M
@@ -26,17 +68,72 @@ def basestore(Model, name='Truss_DataBase.db'):
     dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
     file_path = dir + '/' + name
 
-    # Clear the database if it already exists
+    # Databases with the single-run layout (tables without run_id) are cleared once
     if os.path.exists(file_path):
-        baseclear(file_path)
+        with sqlite3.connect(file_path) as con:
+            columns = [row[1] for row in con.execute("PRAGMA table_info(node)")]
+        con.close()
+        if columns and 'run_id' not in columns:
+            baseclear(file_path)
 
     con = sqlite3.connect(file_path)
     cur = con.cursor()
 
+    # Bulk load settings: write-ahead log with fsync only at checkpoints, so a store is one fast
+    # append that cannot corrupt the runs already stored. One explicit transaction per run
+    cur.execute("PRAGMA journal_mode = WAL")
+    cur.execute("PRAGMA synchronous = NORMAL")
+    cur.execute("PRAGMA cache_size = -65536")
+    cur.execute("PRAGMA foreign_keys = ON")
+    cur.execute("BEGIN")
+
+    _tables(cur)
+
+    # Runs with the same content are stored once, the time of the run is updated so it is the
+    # last run stored (read by default with VIBdata)
+    row = cur.execute("SELECT run_id FROM runs WHERE hash = ?", (key,)).fetchone()
+    if row is not None and not overwrite:
+        cur.execute("UPDATE runs SET created = ? WHERE run_id = ?", (time.time(), row[0]))
+        con.commit()
+        con.close()
+        return {'run_id': row[0], 'stored': False, 'rows': 0, 'seconds': time.time() - t0, 'rows_per_sec': 0.0}
+    if row is not None:
+        cur.execute("DELETE FROM runs WHERE run_id = ?", (row[0],))     # Cascades to all tables
+
+    cur.execute("INSERT INTO runs (hash, params, created) VALUES (?, ?, ?)",
+                (key, json.dumps(jsonable(params), sort_keys=True), time.time()))
+    run_id = cur.lastrowid
+    var = (run_id, ldof, nno, nne, ndof)
+
+    rows = baseinsert(X, C, mprop, bound, spring_support, var, Mmat, Kmat, omega, U, cur, storage)
+
+    # Indexes are built after the bulk insert of the first run, later runs are inserted into the
+    # existing indexes (rebuilding them for all runs would cost more than indexing one run)
+    _indexes(cur)
+
+    con.commit()
+    con.close()
+
+    seconds = time.time() - t0
+    return {'run_id': run_id, 'stored': True, 'rows': rows, 'seconds': seconds, 'rows_per_sec': rows/seconds if seconds > 0 else float('inf')}
+
+def _tables(cur):
+    # Tables of all runs, each row references its run. The primary keys start with run_id, so the
+    # rows of one run are read with an index range scan
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS runs (
+        run_id  INTEGER PRIMARY KEY,
+        hash    TEXT NOT NULL UNIQUE,
+        params  TEXT NOT NULL,
+        created REAL
+    )
+    """)
+
     # Define tables for structure
     cur.execute("""
     CREATE TABLE IF NOT EXISTS var (
-        id   INTEGER PRIMARY KEY,
+        id   INTEGER PRIMARY KEY REFERENCES runs(run_id) ON DELETE CASCADE,
         ldof INTEGER NOT NULL,
         nno  INTEGER NOT NULL,
         nne  INTEGER NOT NULL,
@@ -46,25 +143,30 @@ def basestore(Model, name='Truss_DataBase.db'):
 
     cur.execute("""
     CREATE TABLE IF NOT EXISTS node (
-        id INTEGER PRIMARY KEY,
+        run_id INTEGER NOT NULL REFERENCES runs(run_id) ON DELETE CASCADE,
+        id INTEGER NOT NULL,
         x REAL NOT NULL,
         y REAL NOT NULL,
-        z REAL NOT NULL
+        z REAL NOT NULL,
+        PRIMARY KEY (run_id, id)
     )
     """)
-    
+
     cur.execute("""
     CREATE TABLE IF NOT EXISTS connectivity (
-        id INTEGER PRIMARY KEY,
+        run_id INTEGER NOT NULL REFERENCES runs(run_id) ON DELETE CASCADE,
+        id INTEGER NOT NULL,
         node1 INTEGER NOT NULL,
         node2 INTEGER NOT NULL,
-        propno INTEGER NOT NULL
+        propno INTEGER NOT NULL,
+        PRIMARY KEY (run_id, id)
     )
     """)
 
     cur.execute("""
     CREATE TABLE IF NOT EXISTS material (
-        propno INTEGER PRIMARY KEY,
+        run_id INTEGER NOT NULL REFERENCES runs(run_id) ON DELETE CASCADE,
+        propno INTEGER NOT NULL,
         E REAL NOT NULL,
         A REAL NOT NULL,
         rho REAL NOT NULL,
@@ -72,12 +174,14 @@ def basestore(Model, name='Truss_DataBase.db'):
         Iz REAL NOT NULL,
         J REAL NOT NULL,
         G REAL NOT NULL,
-        type TEXT
+        type TEXT,
+        PRIMARY KEY (run_id, propno)
     )
     """)
 
     cur.execute("""
     CREATE TABLE IF NOT EXISTS bound (
+        run_id INTEGER NOT NULL REFERENCES runs(run_id) ON DELETE CASCADE,
         node INTEGER NOT NULL,
         ldof INTEGER NOT NULL,
         disp REAL NOT NULL
@@ -86,53 +190,90 @@ def basestore(Model, name='Truss_DataBase.db'):
 
     cur.execute("""
     CREATE TABLE IF NOT EXISTS spring (
+        run_id INTEGER NOT NULL REFERENCES runs(run_id) ON DELETE CASCADE,
         node INTEGER NOT NULL,
         ldof INTEGER NOT NULL,
         Kk REAL NOT NULL
     )
     """)
 
-    # Define tables for Mass
+    # Define tables for eigenvalues
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS Eigenvalues (
+        run_id INTEGER NOT NULL REFERENCES runs(run_id) ON DELETE CASCADE,
+        id INTEGER NOT NULL,
+        omega REAL,
+        PRIMARY KEY (run_id, id)
+    )
+    """)
+
+    # Define tables for Mass, stiffness and eigenvectors, one row per nonzero entry (storage='rows')
     cur.execute("""
     CREATE TABLE IF NOT EXISTS Mass (
+        run_id INTEGER NOT NULL REFERENCES runs(run_id) ON DELETE CASCADE,
         i INTEGER NOT NULL,
         j INTEGER NOT NULL,
         m REAL NOT NULL
     )
     """)
 
-    # Define tables for stiffness
     cur.execute("""
     CREATE TABLE IF NOT EXISTS Stiffness (
+        run_id INTEGER NOT NULL REFERENCES runs(run_id) ON DELETE CASCADE,
         i INTEGER NOT NULL,
         j INTEGER NOT NULL,
         k REAL NOT NULL
     )
     """)
 
-    # Define tables for eigenvalues
     cur.execute("""
-    CREATE TABLE IF NOT EXISTS Eigenvalues (
-        id INTEGER PRIMARY KEY,
-        omega REAL
+    CREATE TABLE IF NOT EXISTS Eigenvectors (
+        run_id INTEGER NOT NULL REFERENCES runs(run_id) ON DELETE CASCADE,
+        i INTEGER NOT NULL,
+        j INTEGER NOT NULL,
+        U REAL NOT NULL
     )
     """)
 
-    # Define tables for eigenvectors
+    # Define tables for the matrices (CSR arrays) and eigenvectors (one row per mode) (storage='blob')
     cur.execute("""
-    CREATE TABLE IF NOT EXISTS Eigenvectors (
-        i INTEGER NOT NULL,
+    CREATE TABLE IF NOT EXISTS Matrices (
+        run_id INTEGER NOT NULL REFERENCES runs(run_id) ON DELETE CASCADE,
+        name TEXT NOT NULL,
+        format TEXT NOT NULL,
+        nrows INTEGER NOT NULL,
+        ncols INTEGER NOT NULL,
+        indptr BLOB,
+        indices BLOB,
+        data BLOB NOT NULL,
+        PRIMARY KEY (run_id, name)
+    )
+    """)
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS Modes (
+        run_id INTEGER NOT NULL REFERENCES runs(run_id) ON DELETE CASCADE,
         j INTEGER NOT NULL,
-        U REAL NOT NULL
+        U BLOB NOT NULL,
+        PRIMARY KEY (run_id, j)
     )
     """)
 
-    baseinsert(X, C, mprop, bound, spring_support, var, Mmat, Kmat, omega, U, cur)
-    
-    # Add indexes for faster queries
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_mass_ij ON Mass(i, j);")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_stiffness_ij ON Stiffness(i, j);")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_eigenvec_ij ON Eigenvectors(i, j);")
+def _indexes(cur):
+    # Add indexes for faster queries of one run, and of one mode across runs. The indexes start
+    # with run_id, except for the mode index
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_bound_run ON bound(run_id);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_spring_run ON spring(run_id);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_mass_ij ON Mass(run_id, i, j);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_stiffness_ij ON Stiffness(run_id, i, j);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_eigenvec_ji ON Eigenvectors(run_id, j, i);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_eigenvalues_mode ON Eigenvalues(id, run_id);")
 
-    con.commit()
-    con.close()
\ No newline at end of file
+def _hash(Model, params):
+    # Content hash of a run: the model input with all options that change the results (as in the
+    # result cache), the parameters and the results, so runs with different results never share a hash
+    h = hashlib.sha1(Model.hash().encode())
+    h.update(json.dumps(jsonable(params), sort_keys=True).encode())
+    for a in (Model.omega, Model.U):
+        h.update(np.ascontiguousarray(a, dtype=float).tobytes())
+    return h.hexdigest()
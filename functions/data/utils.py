@@ -0,0 +1,12 @@
+import numpy as np
+
+def jsonable(obj):
+    # Convert numpy arrays and scalars for json, used by all content hashes (VIBcache, VIBsweep,
+    # basestore) so the same input is always serialized the same way
+    if isinstance(obj, dict):
+        return {str(k): jsonable(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple, np.ndarray)):
+        return [jsonable(v) for v in obj]
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return obj
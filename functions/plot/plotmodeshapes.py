@@ -2,6 +2,7 @@ import numpy as np
 import math
 import matplotlib.pyplot as plt
 from functions.plot.utils import getPlotAxsLim, plotSettings, plotStructure, set_axes_equal, plotModeShape
+from functions.Mmat.freedofs import freedofs
 
 def plotmodeshapes(Model, mode=0, scale=1.0, figsize=[6.4,4.8], dpi=100,  mainscale=0.015):
     """
@@ -28,16 +29,13 @@ def plotmodeshapes(Model, mode=0, scale=1.0, figsize=[6.4,4.8], dpi=100,  mainsc
     # Initialize a full DOF vector (including constrained DOFs)
     U_mode = np.zeros(ldof * nno)  # Full DOF array (3 DOFs per node)
 
-    if np.any(bound):
-        dof = list(range(0, ldof * nno))        # Index of total degrees of freedom
-        du = [int((bound[i,0] - 1)*ldof + bound[i,1] - 1) for i in range(bound.shape[0])]
-        df = list(set(dof) - set(du))           # Index for unknown displacements
+    # Free DOFs stored on the model, or computed from the boundary conditions (e.g. for VIBdata)
+    df = getattr(Model, 'df', None)
+    if df is None:
+        df = freedofs(bound, nno, ldof)
 
-        # Assign only the free DOFs
-        U_mode[df] = U[:, mode]  # Map free DOFs to the correct locations
-
-    else:
-        U_mode = U[:, mode]
+    # Assign only the free DOFs
+    U_mode[df] = U[:, mode]  # Map free DOFs to the correct locations
 
     # Reshape to (nno, 2) for visualization
     U_mode = U_mode.reshape((nno, 6))
@@ -0,0 +1,99 @@
+import numpy as np
+from scipy import linalg
+from scipy.sparse import issparse
+from scipy.sparse.linalg import splu
+from functions.Mmat.freedofs import freedofs
+
+def harmonic(Model, freq, inputs, outputs, zeta=0.01, kind='receptance', residual=None):
+    """
+    Harmonic frequency response functions by modal superposition, evaluated for all excitation
+    frequencies, outputs and inputs at once. With the mass-normalized modes phi_r of the solved
+    model, H(w) = sum_r phi_r[out] phi_r[in] / (omega_r**2 - w**2 + 2j zeta_r omega_r w)
+    (receptance), optionally with a residual flexibility correction for the truncated modes.
+
+    Parameters
+    ----------
+    Model : VIBframe
+        Solved model (K, M, omega, U). The lowest modes should be solved (solve_subset from 0)
+    freq : np.array
+        Excitation circular frequencies [rad/s]
+    inputs : np.array
+        Input (force) dofs = [node number, dof]
+    outputs : np.array
+        Output (response) dofs = [node number, dof]
+    zeta : float or np.array, optional
+        Modal damping ratio, for all modes or per mode (default is 0.01)
+    kind : str, optional
+        'receptance' (displacement/force), 'mobility' (velocity/force) or 'accelerance'
+        (acceleration/force) (default is 'receptance')
+    residual : bool, optional
+        If True, the static contribution of the truncated modes, K^-1 - sum_r phi_r phi_r^T / omega_r**2,
+        is added. It requires a supported structure (K nonsingular). If None, it is added when
+        the model has boundary conditions (default is None)
+
+    Returns
+    -------
+    H : np.array
+        Complex frequency response functions, shape (len(freq), number of outputs, number of inputs)
+    """
+
+    K, M, ldof = Model.K, Model.M, Model.ldof
+    freq = np.atleast_1d(np.asarray(freq, dtype=float))
+    omega = np.nan_to_num(Model.omega)
+    zeta = np.broadcast_to(np.asarray(zeta, dtype=float), omega.shape)
+
+    df = getattr(Model, 'df', None)
+    if df is None:
+        df = freedofs(Model.bound, Model.nno, ldof)
+    i_in = _dofs(inputs, df, ldof)
+    i_out = _dofs(outputs, df, ldof)
+
+    # Mass-normalized mode shapes, phi^T M phi = 1
+    Uf = np.zeros((Model.nno*ldof, Model.U.shape[1]))
+    Uf[df] = Model.U
+    if np.ndim(M) == 1:
+        mm = np.einsum('i,ij->j', M, Uf**2)
+    else:
+        mm = np.einsum('ij,ij->j', Uf, M @ Uf)
+    phi = Model.U / np.sqrt(mm)
+
+    # Receptance of the solved modes for all frequencies at once, shape (nfreq, nout, nin)
+    den = omega**2 - freq[:,None]**2 + 2j*zeta*omega*freq[:,None]
+    H = np.einsum('or,fr,ir->foi', phi[i_out], 1/den, phi[i_in])
+
+    # Residual flexibility of the truncated modes (frequency independent)
+    if residual is None:
+        residual = bool(np.any(Model.bound))
+    if residual:
+        H += _residual(K, df, i_in, i_out, phi, omega)
+
+    if kind == 'mobility':
+        H *= 1j*freq[:,None,None]
+    elif kind == 'accelerance':
+        H *= -freq[:,None,None]**2
+    elif kind != 'receptance':
+        raise ValueError("kind must be 'receptance', 'mobility' or 'accelerance'")
+
+    return H
+
+def _dofs(rows, df, ldof):
+    # Position among the free dofs of the dofs given as [node number, dof]
+    rows = np.atleast_2d(rows)
+    dof = ((rows[:,0] - 1)*ldof + rows[:,1] - 1).astype(int)
+    idx = np.searchsorted(df, dof)
+    if np.any(idx >= df.size) or np.any(df[np.minimum(idx, df.size - 1)] != dof):
+        raise ValueError('Input and output dofs must be free (not constrained) dofs')
+    return idx
+
+def _residual(K, df, i_in, i_out, phi, omega):
+    # Static flexibility minus the static part of the solved modes, K^-1[out, in] - sum_r phi phi / omega_r**2
+    if np.any(omega <= 0):
+        raise ValueError('Residual flexibility requires a supported structure without rigid body modes')
+    Kf = K[np.ix_(df, df)]
+    E = np.zeros((df.size, i_in.size))
+    E[i_in, np.arange(i_in.size)] = 1.0
+    if issparse(Kf):
+        G = splu(Kf.tocsc()).solve(E)
+    else:
+        G = linalg.solve(Kf, E, assume_a='sym')
+    return G[i_out] - (phi[i_out] / omega**2) @ phi[i_in].T
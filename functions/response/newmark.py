@@ -0,0 +1,226 @@
+import numpy as np
+from scipy import linalg
+from scipy.sparse import issparse, csc_matrix, diags
+from scipy.sparse.linalg import splu
+from functions.Mmat.freedofs import freedofs
+from functions.response.harmonic import _dofs
+
+def newmark(K, M, nno, ldof, bound, dt, loads, inputs, outputs, rayleigh=(0.0, 0.0), gamma=0.5, beta=0.25,
+            u0=None, v0=None, df=None):
+    """
+    Transient response with the Newmark-beta method on the full system matrices. The damping
+    is Rayleigh damping, C = a*M + b*K, and the effective stiffness matrix is factorized once.
+    The loads are read and the response is returned chunk by chunk (generator), so long time
+    histories do not need to fit in memory, e.g.
+
+        for u, v, a in newmark(K, M, nno, ldof, bound, dt, loadchunks(F), inputs, outputs):
+            f.write(u.tobytes())
+
+    Parameters
+    ----------
+    K : np.array or scipy.sparse matrix
+        System stiffness matrix
+    M : np.array or scipy.sparse matrix
+        System mass matrix, or its diagonal as a vector for a lumped mass matrix
+    nno : int
+        Total number of nodes
+    ldof : int
+        Number of degrees of freedom per node
+    bound : np.array
+        Nodal boundary conditions (fixed dofs)
+    dt : float
+        Time step [s]
+    loads : iterable
+        Chunks of load samples, arrays of shape (number of time steps, number of inputs), e.g. from
+        loadchunks. The first sample is the load at time 0
+    inputs : np.array
+        Loaded dofs = [node number, dof]
+    outputs : np.array
+        Output dofs = [node number, dof]
+    rayleigh : tuple, optional
+        Rayleigh damping coefficients (a, b) (default is (0.0, 0.0))
+    gamma : float, optional
+        Newmark parameter gamma (default is 0.5)
+    beta : float, optional
+        Newmark parameter beta, 0.25 is the unconditionally stable average acceleration method (default is 0.25)
+    u0 : np.array, optional
+        Initial displacements on the free dofs (default is None, zero)
+    v0 : np.array, optional
+        Initial velocities on the free dofs (default is None, zero)
+    df : np.array, optional
+        Sorted index of the free dofs from freedofs (default is None)
+
+    Yields
+    ------
+    u, v, a : np.array
+        Displacements, velocities and accelerations at the output dofs, shape
+        (number of time steps in the chunk, number of outputs)
+    """
+
+    if df is None:
+        df = freedofs(bound, nno, ldof)
+    i_in = _dofs(inputs, df, ldof)
+    i_out = _dofs(outputs, df, ldof)
+
+    # System matrices on the free dofs
+    sparse = issparse(K)
+    if np.ndim(M) == 1:
+        M = diags(M, format='csr') if sparse else np.diag(M)
+    K = K[np.ix_(df, df)]
+    M = M[np.ix_(df, df)]
+    ra, rb = rayleigh
+
+    # Newmark integration constants
+    a0, a1 = 1/(beta*dt**2), gamma/(beta*dt)
+    a2, a3 = 1/(beta*dt), 1/(2*beta) - 1
+    a4, a5 = gamma/beta - 1, dt/2*(gamma/beta - 2)
+
+    # Effective stiffness K + a0*M + a1*C, factorized once
+    Keff = (1 + a1*rb)*K + (a0 + a1*ra)*M
+    solve = _factorized(Keff, sparse)
+
+    n = df.size
+    u = np.zeros(n) if u0 is None else np.array(u0, dtype=float)
+    v = np.zeros(n) if v0 is None else np.array(v0, dtype=float)
+    a = None
+    f = np.zeros(n)
+
+    for chunk in loads:
+        chunk = np.reshape(chunk, (len(chunk), -1))
+        U = np.empty((chunk.shape[0], i_out.size))
+        V, A = np.empty_like(U), np.empty_like(U)
+
+        for k, load in enumerate(chunk):
+            f[:] = 0.0
+            np.add.at(f, i_in, load)
+
+            if a is None:
+                # Initial accelerations from equilibrium at time 0
+                a = _factorized(M, sparse)(f - ra*(M @ v) - rb*(K @ v) - K @ u)
+            else:
+                w = a1*u + a4*v + a5*a
+                p = f + M @ (a0*u + a2*v + a3*a + ra*w) + rb*(K @ w)
+                u_new = solve(p)
+                a_new = a0*(u_new - u) - a2*v - a3*a
+                v = v + dt*((1 - gamma)*a + gamma*a_new)
+                u, a = u_new, a_new
+
+            U[k], V[k], A[k] = u[i_out], v[i_out], a[i_out]
+
+        yield U, V, A
+
+def modal(Model, dt, loads, inputs, outputs, zeta=0.01, gamma=0.5, beta=0.25):
+    """
+    Transient response by modal superposition of the solved modes (modal truncation). The
+    decoupled modal equations q'' + 2 zeta omega q' + omega**2 q = phi^T f are integrated with the
+    Newmark-beta method for all modes at once, starting from rest. Loads and response are
+    processed chunk by chunk as in newmark.
+
+    Parameters
+    ----------
+    Model : VIBframe
+        Solved model (M, omega, U)
+    dt : float
+        Time step [s]
+    loads : iterable
+        Chunks of load samples, shape (number of time steps, number of inputs)
+    inputs : np.array
+        Loaded dofs = [node number, dof]
+    outputs : np.array
+        Output dofs = [node number, dof]
+    zeta : float or np.array, optional
+        Modal damping ratio, for all modes or per mode (default is 0.01)
+    gamma : float, optional
+        Newmark parameter gamma (default is 0.5)
+    beta : float, optional
+        Newmark parameter beta (default is 0.25)
+
+    Yields
+    ------
+    u, v, a : np.array
+        Displacements, velocities and accelerations at the output dofs, shape
+        (number of time steps in the chunk, number of outputs)
+    """
+
+    M, ldof = Model.M, Model.ldof
+    omega = np.nan_to_num(Model.omega)
+    zeta = np.broadcast_to(np.asarray(zeta, dtype=float), omega.shape)
+
+    df = getattr(Model, 'df', None)
+    if df is None:
+        df = freedofs(Model.bound, Model.nno, ldof)
+    i_in = _dofs(inputs, df, ldof)
+    i_out = _dofs(outputs, df, ldof)
+
+    # Mass-normalized mode shapes at the input and output dofs
+    Uf = np.zeros((Model.nno*ldof, Model.U.shape[1]))
+    Uf[df] = Model.U
+    if np.ndim(M) == 1:
+        mm = np.einsum('i,ij->j', M, Uf**2)
+    else:
+        mm = np.einsum('ij,ij->j', Uf, M @ Uf)
+    phi_in = Model.U[i_in] / np.sqrt(mm)
+    phi_out = Model.U[i_out] / np.sqrt(mm)
+
+    # Newmark for the modal equations, the effective stiffness is diagonal
+    c, k = 2*zeta*omega, omega**2
+    a0, a1 = 1/(beta*dt**2), gamma/(beta*dt)
+    a2, a3 = 1/(beta*dt), 1/(2*beta) - 1
+    a4, a5 = gamma/beta - 1, dt/2*(gamma/beta - 2)
+    keff = k + a0 + a1*c
+
+    q, qd, qdd = np.zeros(omega.size), np.zeros(omega.size), None
+
+    for chunk in loads:
+        P = np.reshape(chunk, (len(chunk), -1)) @ phi_in     # Modal loads, shape (nt, nmodes)
+        Q = np.empty_like(P)
+        Qd, Qdd = np.empty_like(P), np.empty_like(P)
+
+        for j, p in enumerate(P):
+            if qdd is None:
+                qdd = p - c*qd - k*q
+            else:
+                q_new = (p + a0*q + a2*qd + a3*qdd + c*(a1*q + a4*qd + a5*qdd)) / keff
+                qdd_new = a0*(q_new - q) - a2*qd - a3*qdd
+                qd = qd + dt*((1 - gamma)*qdd + gamma*qdd_new)
+                q, qdd = q_new, qdd_new
+            Q[j], Qd[j], Qdd[j] = q, qd, qdd
+
+        yield Q @ phi_out.T, Qd @ phi_out.T, Qdd @ phi_out.T
+
+def loadchunks(F, dt=None, nt=None, chunk=1000):
+    """
+    Generator of load chunks for newmark and modal
+
+    Parameters
+    ----------
+    F : np.array or callable
+        Load samples, shape (number of time steps, number of inputs), or a function F(t) returning
+        the loads at the times t (array), shape (len(t), number of inputs)
+    dt : float, optional
+        Time step [s], only for a function F (default is None)
+    nt : int, optional
+        Number of time steps, only for a function F (default is None)
+    chunk : int, optional
+        Number of time steps per chunk (default is 1000)
+
+    Yields
+    ------
+    F : np.array
+        Load samples of the chunk, shape (number of time steps in the chunk, number of inputs)
+    """
+
+    if callable(F):
+        for start in range(0, nt, chunk):
+            t = dt*np.arange(start, min(start + chunk, nt))
+            yield np.reshape(F(t), (t.size, -1))
+    else:
+        for start in range(0, len(F), chunk):
+            yield F[start:start + chunk]
+
+def _factorized(A, sparse):
+    # Solver for the symmetric positive definite matrix A, factorized once
+    if sparse:
+        return splu(csc_matrix(A)).solve
+    c = linalg.cho_factor(A)
+    return lambda b: linalg.cho_solve(c, b)
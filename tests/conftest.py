@@ -0,0 +1,35 @@
+import os
+import sys
+import uuid
+import numpy as np
+import pytest
+
+# The modules are imported from the root of the program, as in the example scripts
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from functions.indata.indata import indata
+from functions.indata.mprop import mprop
+
+def jacket(nn_levels = 4, nne_per_beam = 2, TP = False):
+    # Jacket of EX1.1: X, C and mprop
+    dim_brace = np.array([[12.7, 1]]*nn_levels)*1e-3
+    dim_leg = np.array([[50, 1.5]]*nn_levels)*1e-3
+    E = 205e9
+    X, C = indata(0.753, 0.406, 1.27, nn_levels, nne_per_beam, TP)
+    return X, C, mprop(nn_levels, dim_brace, dim_leg, E, E/(2*(1 + 0.29)), 7870, TP)
+
+@pytest.fixture
+def model():
+    return jacket()
+
+@pytest.fixture
+def dbname():
+    # Unique database name in the root of the program (where basestore and VIBcache write),
+    # removed after the test
+    name = f'test_{uuid.uuid4().hex}.db'
+    yield name
+    for suffix in ('', '-wal', '-shm'):
+        path = os.path.join(ROOT, name + suffix)
+        if os.path.exists(path):
+            os.remove(path)
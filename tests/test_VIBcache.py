@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from classes.VIBframe import VIBframe
+from classes.VIBcache import VIBcache
+
+def test_hit_assembles_matrices(model, dbname):
+    X, C, mprop = model
+    cache = VIBcache(dbname)
+    A = VIBframe(X, C, mprop, [], [], [0, 25], sparse=True, resultcache=cache)
+    B = VIBframe(X, C, mprop, [], [], [0, 25], sparse=True, resultcache=cache)
+
+    assert B.nfa_info['solver'] == 'cache'
+    np.testing.assert_array_equal(B.omega, A.omega)
+    assert abs(B.K - A.K).max() == 0.0 and abs(B.M - A.M).max() == 0.0
+
+def test_matrices_dropped_when_entry_too_large(model, dbname):
+    X, C, mprop = model
+    cache = VIBcache(dbname, maxbytes=3e6, matrices=True)
+    VIBframe(X, C, mprop, [], [], [0, 25], resultcache=cache)
+    B = VIBframe(X, C, mprop, [], [], [0, 25], resultcache=cache)
+
+    # Dense K and M do not fit, omega and U are cached without them
+    assert B.nfa_info['solver'] == 'cache'
+    assert cache.stats()['rejected'] == 0
+
+def test_rejected_entry_is_counted(model, dbname):
+    X, C, mprop = model
+    cache = VIBcache(dbname, maxbytes=1e4)
+    with pytest.warns(UserWarning):
+        VIBframe(X, C, mprop, [], [], [0, 25], resultcache=cache)
+    assert cache.stats()['rejected'] == 1 and cache.stats()['entries'] == 0
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from classes.VIBframe import VIBframe
+from classes.VIBdata import VIBdata
+from functions.data.basestore import basestore
+
+BOUND = np.array([[n, d, 0] for n in range(117, 121) for d in (1, 2, 3)])
+SPRINGS = np.array([[117, 4, 1e6]])
+
+def dense(A):
+    return A.toarray() if hasattr(A, 'toarray') else np.asarray(A)
+
+@pytest.mark.parametrize('storage', ['rows', 'blob'])
+@pytest.mark.parametrize('options', [{}, {'sparse': True}, {'mass': 'lumped'}])
+def test_round_trip(model, dbname, storage, options):
+    X, C, mprop = model
+    V = VIBframe(X, C, mprop, BOUND, SPRINGS, [0, 25], **options)
+    run_id = basestore(V, dbname, storage=storage)['run_id']
+    D = VIBdata(dbname, run=run_id)
+
+    np.testing.assert_array_equal(D.X, X)
+    np.testing.assert_array_equal(D.C, C)
+    np.testing.assert_array_equal(D.bound, BOUND)
+    np.testing.assert_array_equal(D.spring_support, SPRINGS)
+    assert D.mprop == mprop
+    np.testing.assert_array_equal(D.omega, V.omega)
+    np.testing.assert_array_equal(D.U, V.U)
+
+    # The blob storage keeps the upper triangle of symmetric matrices, equal up to the rounding
+    # of the assembly (K and M are symmetric to machine precision)
+    K, M = dense(V.K), np.diag(V.M) if np.ndim(V.M) == 1 else dense(V.M)
+    tol = 0.0 if storage == 'rows' else 1e-14
+    np.testing.assert_allclose(D.Kmat, K, rtol=0, atol=tol*abs(K).max())
+    np.testing.assert_allclose(D.Mmat, M, rtol=0, atol=tol*abs(M).max())
+
+@pytest.mark.parametrize('storage', ['rows', 'blob'])
+def test_modeshape_subsets(model, dbname, storage):
+    X, C, mprop = model
+    V = VIBframe(X, C, mprop, BOUND, SPRINGS, [0, 25])
+    basestore(V, dbname, storage=storage)
+
+    # Full mode shapes on all dofs, zero on the constrained dofs
+    Uf = np.zeros((V.nno*V.ldof, V.U.shape[1]))
+    Uf[V.df] = V.U
+    nodes = np.array([118, 3, 50, 4, 117])
+    rows = ((nodes[:, None] - 1)*V.ldof + np.arange(V.ldof)).ravel()
+
+    D = VIBdata(dbname)
+    np.testing.assert_array_equal(D.modeshapes([6, 20]), V.U[:, 6:20])
+    np.testing.assert_array_equal(D.modeshapes([6, 20], nodes), Uf[rows, 6:20])
+    np.testing.assert_array_equal(D.modeshapes(nodes=nodes), Uf[rows])
+    # Only the requested data is read
+    assert 'U' not in D.__dict__ and 'Kmat' not in D.__dict__
+
+    # The same from the mode shapes in memory
+    D.U
+    np.testing.assert_array_equal(D.modeshapes([6, 20], nodes), Uf[rows, 6:20])
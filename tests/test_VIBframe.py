@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from classes.VIBframe import VIBframe
+
+# Clamped footings (nodes 117-120 of the default mesh)
+BOUND = np.array([[n, d, 0] for n in range(117, 121) for d in range(1, 7)])
+
+def dense(A):
+    return A.toarray() if hasattr(A, 'toarray') else np.asarray(A)
+
+@pytest.mark.parametrize('mass', ['consistent', 'lumped'])
+def test_sparse_equals_dense(model, mass):
+    X, C, mprop = model
+    D = VIBframe(X, C, mprop, BOUND, [], [0, 25], mass=mass)
+    S = VIBframe(X, C, mprop, BOUND, [], [0, 25], mass=mass, sparse=True, solver='sparse')
+
+    np.testing.assert_allclose(dense(S.K), dense(D.K), rtol=0, atol=1e-12*abs(dense(D.K)).max())
+    np.testing.assert_allclose(dense(S.M), dense(D.M), rtol=0, atol=1e-12*abs(dense(D.M)).max())
+    np.testing.assert_allclose(S.omega, D.omega, rtol=1e-8)
+
+@pytest.mark.parametrize('sparse', [False, True])
+def test_update_equals_fresh_build(model, sparse):
+    X, C, mprop = model
+    V = VIBframe(X, C, mprop, BOUND, [], [0, 25], sparse=sparse)
+    damaged = {**mprop[3], 'E': 100e9, 'rho': 9000, 'type': 'damaged'}
+    V.update(props={2: {'E': 150e9, 'A': mprop[2]['A']*0.8}, 99: damaged}, elements={10: 99, 40: 99})
+
+    # The same model built from scratch
+    mprop2 = {p: dict(d) for p, d in mprop.items()}
+    mprop2[2].update(E=150e9, A=mprop[2]['A']*0.8)
+    mprop2[99] = damaged
+    C2 = C.copy()
+    C2[[9, 39], 2] = 99
+    R = VIBframe(X, C2, mprop2, BOUND, [], [0, 25], sparse=sparse)
+
+    np.testing.assert_allclose(dense(V.K), dense(R.K), rtol=0, atol=1e-12*abs(dense(R.K)).max())
+    np.testing.assert_allclose(dense(V.M), dense(R.M), rtol=0, atol=1e-12*abs(dense(R.M)).max())
+    np.testing.assert_allclose(V.omega, R.omega, rtol=1e-8)
+    # The input dictionary of the model is not modified
+    assert mprop[2]['E'] != 150e9
+
+@pytest.mark.parametrize('solver, target', [('sparse', None), ('sparse', 900.0), ('subspace', None)])
+def test_mass_update_equals_fresh_solve(model, solver, target):
+    # Mass-only updates reuse the factorization of K, also for large changes of M
+    X, C, mprop = model
+    V = VIBframe(X, C, mprop, BOUND, [], [0, 10], sparse=True, solver=solver, target=target)
+    for m in (0.5, 50.0):
+        point_mass = np.array([[n, d, m] for n in range(100, 116) for d in (1, 2, 3)])
+        V.update(point_mass=point_mass)
+        R = VIBframe(X, C, mprop, BOUND, [], [0, 10], sparse=True, solver=solver, target=target,
+                     point_mass=point_mass)
+        np.testing.assert_allclose(V.omega, R.omega, rtol=1e-8)
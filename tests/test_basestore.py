@@ -0,0 +1,33 @@
+import numpy as np
+
+from classes.VIBframe import VIBframe
+from classes.VIBdata import VIBdata
+from functions.data.basestore import basestore
+
+def test_same_model_is_stored_once(model, dbname):
+    X, C, mprop = model
+    A = VIBframe(X, C, mprop, [], [], [0, 25])
+    B = VIBframe(X, C, mprop, [], [], [0, 25], mass='lumped')
+
+    first = basestore(A, dbname)
+    basestore(B, dbname)
+    again = basestore(A, dbname)
+
+    assert first['stored'] and not again['stored']
+    assert again['run_id'] == first['run_id']
+    # The run stored last is read by default, also after a deduplicated store
+    assert VIBdata(dbname).run_id == first['run_id']
+
+def test_options_that_change_results_create_runs(model, dbname):
+    X, C, mprop = model
+    nno = X.shape[0]
+    models = [VIBframe(X, C, mprop, [], [], [0, 25]),
+              VIBframe(X, C, mprop, [], [], [0, 25], reduce=['internal', 'rotations']),
+              VIBframe(X, C, mprop, [], [], [0, 25], footing=np.arange(nno - 7, nno - 3))]
+
+    runs = [basestore(Model, dbname) for Model in models]
+    assert all(st['stored'] for st in runs)
+    assert len({st['run_id'] for st in runs}) == len(models)
+
+    for Model, st in zip(models, runs):
+        np.testing.assert_array_equal(VIBdata(dbname, run=st['run_id']).omega, Model.omega)
@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+from conftest import jacket
+from functions.Kmat.buildKM import buildKM
+
+def dense(A):
+    return A.toarray() if hasattr(A, 'toarray') else np.asarray(A)
+
+@pytest.mark.parametrize('mass', ['consistent', 'lumped'])
+def test_parallel_assembly_is_bitwise_identical(mass):
+    X, C, mprop = jacket(nne_per_beam=8)
+    nno, nne = X.shape[0], C.shape[0]
+    K0, M0, _ = buildKM(X, C, mprop, [], nno, nne, 6, sparse=True, mass=mass)
+
+    parts = [buildKM(X, C, mprop, [], nno, nne, 6, sparse=True, mass=mass, workers=workers, chunksize=64)
+             for workers in (1, 2, 4)]
+    for K, M, _ in parts[1:]:
+        # Same chunks, summed in the same order: identical for any number of workers
+        np.testing.assert_array_equal(dense(K), dense(parts[0][0]))
+        np.testing.assert_array_equal(dense(M), dense(parts[0][1]))
+
+    # and equal to the serial assembly up to rounding
+    K, M, _ = parts[0]
+    assert abs(K - K0).max() <= 1e-12*abs(K0).max()
+    assert abs(M - M0).max() <= 1e-12*abs(M0).max()
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from classes.VIBframe import VIBframe
+from functions.Mmat.sensitivity import sensitivity
+
+BOUND = np.array([[n, d, 0] for n in range(117, 121) for d in (1, 2, 3)])
+SPRINGS = np.array([[117, 4, 1e6], [118, 6, 2e6]])
+
+@pytest.mark.parametrize('options', [{}, {'mass': 'lumped'}, {'sparse': True}])
+def test_sensitivity_matches_finite_differences(model, options):
+    X, C, mprop = model
+    V = VIBframe(X, C, mprop, BOUND, SPRINGS, [0, 15], **options)
+    domega, labels = sensitivity(V)
+
+    # Modes well separated from their neighbours, where the frequencies are differentiable
+    gap = np.minimum(np.r_[np.inf, np.diff(V.omega)], np.r_[np.diff(V.omega), np.inf])
+    modes = gap > 1e-3*V.omega
+
+    for p in [(1, 'E'), (2, 'rho'), (3, 'Iz'), ('spring', 0)]:
+        j = labels.index(p)
+        omega = []
+        for sign in (1, -1):
+            mprop2, springs2 = {q: dict(d) for q, d in mprop.items()}, SPRINGS.copy()
+            if p[0] == 'spring':
+                h = 1e-3*SPRINGS[p[1], 2]
+                springs2[p[1], 2] += sign*h
+            else:
+                h = 1e-3*mprop[p[0]][p[1]]
+                mprop2[p[0]][p[1]] += sign*h
+            omega.append(VIBframe(X, C, mprop2, BOUND, springs2, [0, 15], **options).omega)
+        fd = (omega[0] - omega[1])/(2*h)
+        np.testing.assert_allclose(domega[modes, j], fd[modes], rtol=0, atol=1e-3*abs(fd[modes]).max())